@@ -1,11 +1,19 @@
 from contextlib import contextmanager
 
+from gevent.local import local
+
 from odoo.api import Environment, Environments
 from odoo import SUPERUSER_ID
 
 
-class FakeLocal(object):
-    environments = Environments()
+class FakeLocal(local):
+
+    # Environments per greenlet, like Odoo keeps them per thread.
+    # Greenlets working on cursors of their own must not share caches,
+    # pending recomputes or the recompute flag.
+
+    def __init__(self):
+        self.environments = Environments()
 
 
 @contextmanager
@@ -25,24 +25,82 @@ __all__ = [
 @click.option(
     '--config-file'
 )
+@click.option(
+    '--jobs',
+    default=1,
+    type=click.INT,
+    help="Number of models to serialize concurrently."
+)
+@click.option(
+    '--format',
+    default='json',
+    type=click.Choice(['json', 'ndjson']),
+    help="Output a JSON array or one compact JSON record per line."
+)
+@click.option(
+    '--compression',
+    type=click.Choice(['gzip', 'zstd']),
+)
+@click.option(
+    '--since',
+    help="Only export records changed since this UTC timestamp, or the watermark of a manifest file."
+)
+@click.option(
+    '--manifest',
+    help="File to write the watermark for the next incremental export to."
+)
+@click.option(
+    '--blobs',
+    help="Directory to write binary values to, instead of inlining them."
+)
+@click.option(
+    '--shards',
+    help="Directory to write a file per model and a manifest to, instead of stdout."
+)
 @click.pass_context
-def export(ctx, db_name, strict, link, config_file=None):
+def export(ctx, db_name, strict, link, config_file=None, jobs=1,
+        format='json', compression=None, since=None, manifest=None,
+        blobs=None, shards=None):
     config = (
         ctx.obj['config']
     )
 
+    from odooku.data.manifest import read_watermark, dump_manifest
+    if since:
+        if link:
+            raise click.BadParameter("Links do not resolve across incremental exports, use natural keys.")
+        try:
+            since = read_watermark(since)
+        except (ValueError, KeyError):
+            raise click.BadParameter("--since expects a timestamp or an export manifest.")
+
     from odoo.modules.registry import RegistryManager
     registry = RegistryManager.get(db_name)
 
     from odooku.data.exporter import factory
     from odooku.data.config import DataConfig
-    exporter = factory()(
+    exporter = factory(jobs > 1 and 'parallel' or None)(
         registry,
         config=config_file and DataConfig.from_file(config_file) or DataConfig.defaults(),
         link=link,
         strict=strict,
+        jobs=jobs,
+        format=format,
+        compression=compression,
+        since=since,
+        blobs=blobs,
+        watermark=bool(manifest),
     )
-    exporter.export(sys.stdout)
+    if shards:
+        exporter.export_shards(shards)
+    else:
+        exporter.export(sys.stdout)
+
+    if manifest:
+        dump_manifest(manifest, {
+            'since': since,
+            'watermark': exporter.watermark,
+        })
 
 
 @click.command('import')
@@ -61,22 +119,202 @@ def export(ctx, db_name, strict, link, config_file=None):
 @click.option(
     '--config-file'
 )
+@click.option(
+    '--batch-size',
+    type=click.INT,
+    help="Resolve natural keys for this many consecutive entries at once."
+)
+@click.option(
+    '--pipeline',
+    is_flag=True,
+    help="Parse input concurrently with writing to the database."
+)
+@click.option(
+    '--commit-every',
+    type=click.INT,
+    help="Commit after every this many entries."
+)
+@click.option(
+    '--checkpoint',
+    help="File to keep track of committed entries in."
+)
+@click.option(
+    '--resume',
+    is_flag=True,
+    help="Continue after the entries recorded in the checkpoint."
+)
+@click.option(
+    '--check',
+    is_flag=True,
+    help="Only validate references and required fields, nothing is written."
+)
+@click.option(
+    '--blobs',
+    help="Directory to read binary values of the export from."
+)
+@click.option(
+    '--shards',
+    help="Directory of a sharded export to import instead of stdin."
+)
+@click.option(
+    '--jobs',
+    default=1,
+    type=click.INT,
+    help="Number of shards to import concurrently."
+)
+@click.option(
+    '--links',
+    is_flag=True,
+    help="Keep links in the database, to update the same records on a later import."
+)
+@click.option(
+    '--defer',
+    is_flag=True,
+    help="Disable tracking, recompute computed fields and parent_store in bulk."
+)
 @click.pass_context
-def import_(ctx, db_name, fake, strict, config_file):
+def import_(ctx, db_name, fake, strict, config_file, batch_size=None,
+        pipeline=False, commit_every=None, checkpoint=None, resume=False,
+        check=False, blobs=None, shards=None, jobs=1, links=False,
+        defer=False):
     config = (
         ctx.obj['config']
     )
 
+    if resume and not checkpoint:
+        raise click.BadParameter("--resume requires a --checkpoint file.")
+
+    if checkpoint and not commit_every:
+        raise click.BadParameter("--checkpoint only records commits, it requires --commit-every.")
+
+    if shards and (fake or check or commit_every or resume):
+        raise click.BadParameter("Shards are committed one by one, --fake, --check, --commit-every and --resume don't apply.")
+
     from odoo.modules.registry import RegistryManager
     registry = RegistryManager.get(db_name)
     from odooku.data import Importer
     from odooku.data.config import DataConfig
+    data_config = config_file and DataConfig.from_file(config_file) or DataConfig.defaults()
+
+    if check:
+        from odooku.data.checker import Checker
+        problems = Checker(registry, config=data_config, strict=strict).check(sys.stdin)
+        for problem in problems:
+            click.echo(problem)
+        if problems:
+            ctx.exit(1)
+        return
+
     importer = Importer(
         registry,
-        config=config_file and DataConfig.from_file(config_file) or DataConfig.defaults(),
+        config=data_config,
         strict=strict,
+        batch_size=batch_size,
+        pipeline=pipeline,
+        commit_every=commit_every,
+        checkpoint=checkpoint,
+        blobs=blobs,
+        links=links,
+        defer=defer,
+    )
+    if shards:
+        importer.import_shards(shards, jobs=jobs)
+    else:
+        importer.import_(sys.stdin, fake=fake, resume=resume)
+
+
+@click.command()
+@click.option(
+    '--db-name',
+    callback=resolve_db_name
+)
+@click.option(
+    '--shape',
+    default='flat',
+    type=click.Choice(['flat', 'tree', 'm2m', 'nk']),
+    help="Flat records, parent hierarchies, many2many relations or natural keys."
+)
+@click.option(
+    '--size',
+    default=1000,
+    type=click.INT,
+    help="Number of records to create."
+)
+@click.option(
+    '--relations',
+    default=3,
+    type=click.INT,
+    help="Many2many relations per record, or countries for natural keys."
+)
+@click.option(
+    '--depth',
+    default=5,
+    type=click.INT,
+    help="Depth of parent hierarchies."
+)
+@click.option(
+    '--format',
+    default='json',
+    type=click.Choice(['json', 'ndjson']),
+)
+@click.option(
+    '--jobs',
+    default=1,
+    type=click.INT,
+    help="Number of models to export concurrently."
+)
+@click.option(
+    '--copy',
+    is_flag=True,
+    help="Import the dataset's models with COPY."
+)
+@click.option(
+    '--batch-size',
+    type=click.INT,
+    help="Resolve natural keys for this many consecutive entries at once."
+)
+@click.option(
+    '--pipeline',
+    is_flag=True,
+    help="Parse input concurrently with writing to the database."
+)
+@click.option(
+    '--commit-every',
+    type=click.INT,
+    help="Commit the import after every this many entries, instead of rolling it back."
+)
+@click.option(
+    '--defer',
+    is_flag=True,
+    help="Disable tracking, recompute computed fields and parent_store in bulk."
+)
+@click.pass_context
+def benchmark(ctx, db_name, shape, size, relations, depth, format, jobs=1,
+        copy=False, batch_size=None, pipeline=False, commit_every=None,
+        defer=False):
+    config = (
+        ctx.obj['config']
+    )
+
+    from odoo.modules.registry import RegistryManager
+    registry = RegistryManager.get(db_name)
+
+    from odooku.data.benchmark import run, report
+    results = run(
+        registry,
+        shape,
+        size,
+        relations=relations,
+        depth=depth,
+        format=format,
+        jobs=jobs,
+        copy=copy,
+        batch_size=batch_size,
+        pipeline=pipeline,
+        commit_every=commit_every,
+        defer=defer
     )
-    importer.import_(sys.stdin, fake=fake)
+    click.echo(report(results))
 
 
 @click.group()
@@ -87,3 +325,4 @@ def data(ctx):
 
 data.add_command(export)
 data.add_command(import_)
+data.add_command(benchmark)
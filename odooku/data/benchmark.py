@@ -0,0 +1,214 @@
+from collections import OrderedDict
+import logging
+import tempfile
+import uuid
+
+from odooku.api import environment
+from odooku.data.config import DataConfig
+from odooku.data.exporter import DefaultExporter, ParallelExporter
+from odooku.data.importer import Importer
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Fields that refer to the record itself or to users, as in the
+# account export config.
+EXCLUDES = {
+    'res.partner': ['commercial_partner_id', 'create_uid', 'write_uid'],
+    'res.partner.category': ['create_uid', 'write_uid'],
+}
+
+
+class BenchmarkMixin(object):
+
+    def __init__(self, registry, config, dataset, **kwargs):
+        super(BenchmarkMixin, self).__init__(registry, config, **kwargs)
+        self._dataset = dataset
+
+    def _lookup(self, model):
+        # Leave out whatever was in the database before
+        lookup = super(BenchmarkMixin, self)._lookup(model)
+        if model._name in self._dataset.models:
+            lookup = lookup + self._dataset.lookup()
+        return lookup
+
+
+class BenchmarkExporter(BenchmarkMixin, DefaultExporter):
+    pass
+
+
+class ParallelBenchmarkExporter(BenchmarkMixin, ParallelExporter):
+    pass
+
+
+class Dataset(object):
+
+    models = []
+
+    def __init__(self, size, relations=3, depth=5):
+        self.size = size
+        self.relations = relations
+        self.depth = depth
+        self.tag = 'odooku-benchmark-%s' % uuid.uuid4().hex[:8]
+
+    def config(self, copy=False):
+        return DataConfig(includes=list(self.models), models=dict([
+            (model_name, {'copy': copy, 'excludes': EXCLUDES.get(model_name, [])})
+            for model_name in self.models
+        ]))
+
+    def lookup(self):
+        return [('name', '=like', self.tag + '%')]
+
+    def create(self, env):
+        raise NotImplementedError()
+
+    def cleanup(self, env):
+        for model_name in reversed(self.models):
+            env[model_name].with_context(active_test=False).search(self.lookup()).unlink()
+
+
+class FlatDataset(Dataset):
+
+    models = ['res.partner']
+
+    def create(self, env):
+        partners = env['res.partner'].with_context(tracking_disable=True)
+        for i in xrange(self.size):
+            partners.create({
+                'name': '%s-%s' % (self.tag, i),
+                'email': '%s@example.com' % i,
+            })
+
+
+class TreeDataset(Dataset):
+
+    # Chains of categories, each pointing to the previous one
+    models = ['res.partner.category']
+
+    def create(self, env):
+        categories = env['res.partner.category']
+        parent_id = False
+        for i in xrange(self.size):
+            if i % self.depth == 0:
+                parent_id = False
+            parent_id = categories.create({
+                'name': '%s-%s' % (self.tag, i),
+                'parent_id': parent_id,
+            }).id
+
+
+class ManyToManyDataset(Dataset):
+
+    models = ['res.partner.category', 'res.partner']
+
+    def create(self, env):
+        category_ids = [
+            env['res.partner.category'].create({
+                'name': '%s-category-%s' % (self.tag, i),
+            }).id
+            for i in xrange(max(self.relations * 10, 1))
+        ]
+        partners = env['res.partner'].with_context(tracking_disable=True)
+        for i in xrange(self.size):
+            partners.create({
+                'name': '%s-%s' % (self.tag, i),
+                'category_id': [(6, 0, [
+                    category_ids[(i + j) % len(category_ids)]
+                    for j in xrange(self.relations)
+                ])],
+            })
+
+
+class NaturalKeyDataset(Dataset):
+
+    # Partners only refer to other records through natural keys
+    models = ['res.partner']
+
+    def config(self, copy=False):
+        return DataConfig(includes=list(self.models), models={
+            'res.partner': {'nk': ['ref'], 'copy': copy, 'excludes': EXCLUDES['res.partner']},
+            'res.country': {'nk': ['code']},
+        })
+
+    def create(self, env):
+        country_ids = env['res.country'].search([], limit=max(self.relations, 1)).ids
+        partners = env['res.partner'].with_context(tracking_disable=True)
+        parent_id = False
+        for i in xrange(self.size):
+            if i % self.depth == 0:
+                parent_id = False
+            parent_id = partners.create({
+                'name': '%s-%s' % (self.tag, i),
+                'ref': '%s-%s' % (self.tag, i),
+                'country_id': country_ids and country_ids[i % len(country_ids)] or False,
+                'parent_id': parent_id,
+            }).id
+
+
+datasets = {
+    'flat': FlatDataset,
+    'tree': TreeDataset,
+    'm2m': ManyToManyDataset,
+    'nk': NaturalKeyDataset,
+}
+
+
+def _cleanup(registry, dataset):
+    with registry.cursor() as cr:
+        with environment(cr) as env:
+            dataset.cleanup(env)
+
+
+def run(registry, shape, size, relations=3, depth=5, format='json',
+        jobs=1, copy=False, batch_size=None, pipeline=False,
+        commit_every=None, defer=False):
+    # Seeds a dataset, exports it, removes it and imports the export
+    # again, so that every record is created. The import is rolled back
+    # unless it commits along the way. Returns the stats of both phases.
+    dataset = datasets[shape](size, relations=relations, depth=depth)
+    config = dataset.config(copy=copy)
+
+    with registry.cursor() as cr:
+        with environment(cr) as env:
+            _logger.info("Creating %s dataset of %s records" % (shape, size))
+            dataset.create(env)
+
+    try:
+        # Links map the records of the export onto the new ones
+        exporter = (jobs > 1 and ParallelBenchmarkExporter or BenchmarkExporter)(
+            registry,
+            config=config,
+            dataset=dataset,
+            link=True,
+            jobs=jobs,
+            format=format
+        )
+        importer = Importer(
+            registry,
+            config=config,
+            batch_size=batch_size,
+            pipeline=pipeline,
+            commit_every=commit_every,
+            defer=defer
+        )
+        with tempfile.TemporaryFile() as fp:
+            exporter.export(fp)
+            _cleanup(registry, dataset)
+            fp.seek(0)
+            importer.import_(fp, fake=not commit_every)
+    finally:
+        _cleanup(registry, dataset)
+
+    return OrderedDict([
+        ('export', exporter.stats),
+        ('import', importer.stats),
+    ])
+
+
+def report(results):
+    return '\n\n'.join([
+        "%s\n%s" % (phase, stats.summary())
+        for (phase, stats) in results.iteritems()
+    ])
@@ -0,0 +1,30 @@
+import hashlib
+import os
+
+
+class BlobStore(object):
+
+    # Binary values stored once per checksum in a directory next to an
+    # export, only the checksum ends up in the JSON.
+
+    def __init__(self, path):
+        self._path = path
+
+    def _blob_path(self, checksum):
+        return os.path.join(self._path, checksum[:2], checksum)
+
+    def put(self, data):
+        checksum = hashlib.sha1(data).hexdigest()
+        path = self._blob_path(checksum)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(path + '.tmp', 'wb') as fp:
+                fp.write(data)
+            os.rename(path + '.tmp', path)
+        return checksum
+
+    def get(self, checksum):
+        with open(self._blob_path(checksum), 'rb') as fp:
+            return fp.read()
@@ -0,0 +1,131 @@
+import cPickle
+import tempfile
+
+
+class BufferBudget(object):
+
+    # Bytes that any number of buffers may hold in memory together
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+
+    def reserve(self, size):
+        if self.size + size <= self.limit:
+            self.size += size
+            return True
+        return False
+
+    def release(self, size):
+        self.size -= size
+
+
+class SpillBuffer(object):
+
+    # Items are kept pickled in memory up to a limit in bytes, anything
+    # beyond that goes to a temporary file. The limit is either a
+    # number of bytes or a budget shared with other buffers.
+
+    def __init__(self, limit):
+        if not isinstance(limit, BufferBudget):
+            limit = BufferBudget(limit)
+        self._budget = limit
+        self._size = 0
+        self._file = None
+
+    def _dumps(self, item):
+        return cPickle.dumps(item, cPickle.HIGHEST_PROTOCOL)
+
+    def _fits(self, data):
+        if self._file is None and self._budget.reserve(len(data)):
+            self._size += len(data)
+            return True
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        return False
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def close(self):
+        self._budget.release(self._size)
+        self._size = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SpillList(SpillBuffer):
+
+    def __init__(self, limit):
+        super(SpillList, self).__init__(limit)
+        self._items = []
+        self._spilled = 0
+
+    def __len__(self):
+        return len(self._items) + self._spilled
+
+    def append(self, item):
+        data = self._dumps(item)
+        if self._fits(data):
+            self._items.append(data)
+        else:
+            self._file.write(data)
+            self._spilled += 1
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def close(self):
+        self._items = []
+        self._spilled = 0
+        super(SpillList, self).close()
+
+    def __iter__(self):
+        # Spilled items always come after the ones in memory
+        for data in self._items:
+            yield cPickle.loads(data)
+
+        if self._spilled:
+            self._file.flush()
+            self._file.seek(0)
+            for _ in xrange(self._spilled):
+                yield cPickle.load(self._file)
+            self._file.seek(0, 2)
+
+
+class SpillDict(SpillBuffer):
+
+    def __init__(self, limit):
+        super(SpillDict, self).__init__(limit)
+        # Either pickled data, or an (offset, length) into the file
+        self._items = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __setitem__(self, key, item):
+        data = self._dumps(item)
+        if self._fits(data):
+            self._items[key] = data
+        else:
+            self._file.seek(0, 2)
+            self._items[key] = (self._file.tell(), len(data))
+            self._file.write(data)
+
+    def __getitem__(self, key):
+        data = self._items[key]
+        if isinstance(data, tuple):
+            (offset, length) = data
+            self._file.seek(offset)
+            data = self._file.read(length)
+        return cPickle.loads(data)
+
+    def close(self):
+        self._items = {}
+        super(SpillDict, self).close()
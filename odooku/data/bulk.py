@@ -0,0 +1,139 @@
+from cStringIO import StringIO
+import logging
+
+from odoo import models
+from odoo.fields import Datetime
+
+from odooku.data.exceptions import ReferenceMissing
+
+
+_logger = logging.getLogger(__name__)
+
+
+LOG_ACCESS_COLUMNS = ['create_uid', 'create_date', 'write_uid', 'write_date']
+
+
+def _overrides(model, method):
+    return any([
+        method in cls.__dict__
+        for cls in type(model).__mro__
+        if cls not in (models.BaseModel, models.Model, object)
+    ])
+
+
+def copy_columns(model):
+    # Columns of a model that can be loaded without the ORM, or None
+    # when creating a record involves more than inserting a row.
+    if (not model._auto or model._inherits
+            or getattr(model, '_parent_store', False)
+            or model._constraints or model._constraint_methods
+            or _overrides(model, 'create')):
+        return None
+
+    columns = []
+    for (field_name, field) in model._fields.iteritems():
+        if not field.store or not field.column_type:
+            continue
+        if field.compute or field.inverse or field.translate or field.type == 'binary':
+            return None
+        # Rows of a batch are deserialized before any of them exist
+        if field.type == 'many2one' and field.comodel_name == model._name:
+            return None
+        columns.append(field_name)
+    return columns
+
+
+def preallocate_ids(model, count):
+    model.env.cr.execute(
+        "SELECT nextval(%s) FROM generate_series(1, %s)",
+        ('%s_id_seq' % model._table, count)
+    )
+    return [id for (id,) in model.env.cr.fetchall()]
+
+
+def check_references(model, rows):
+    # Fails the whole batch at once instead of on the first foreign key
+    for (field_name, field) in model._fields.iteritems():
+        if field.type != 'many2one' or not field.store:
+            continue
+
+        ids = set([row[field_name] for row in rows if row.get(field_name)])
+        if field.comodel_name == model._name:
+            ids -= set([row['id'] for row in rows])
+        if not ids:
+            continue
+
+        found = set(model.env[field.comodel_name].browse(list(ids)).exists()._ids)
+        if ids - found:
+            raise ReferenceMissing("%s.%s refers to missing %s records %s" % (
+                model._name, field_name, field.comodel_name, sorted(ids - found)
+            ))
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    elif value is True:
+        return 't'
+    elif value is False:
+        return 'f'
+    elif isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = str(value)
+    return (value
+        .replace('\\', '\\\\')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+        .replace('\t', '\\t')
+    )
+
+
+def copy_rows(model, columns, rows):
+    # Rows are deserialized values including a preallocated id
+    missing = [
+        field_name for field_name in columns
+        if field_name not in LOG_ACCESS_COLUMNS and not all([
+            field_name in row for row in rows
+        ])
+    ]
+    defaults = model.default_get(missing) if missing else {}
+    if model._log_access:
+        now = Datetime.now()
+        defaults.update({
+            'create_uid': model.env.uid,
+            'create_date': now,
+            'write_uid': model.env.uid,
+            'write_date': now,
+        })
+
+    log_access = dict([
+        (field_name, value)
+        for (field_name, value) in defaults.iteritems()
+        if field_name in LOG_ACCESS_COLUMNS
+    ])
+    for (i, row) in enumerate(rows):
+        rows[i] = dict(defaults)
+        rows[i].update(row)
+        # Like create, never take these from the values
+        rows[i].update(log_access)
+
+    check_references(model, rows)
+
+    record = model.browse()
+    fp = StringIO()
+    for row in rows:
+        fp.write('\t'.join([
+            _copy_value(model._fields[field_name].convert_to_column(row.get(field_name, False), record))
+            for field_name in columns
+        ]))
+        fp.write('\n')
+    fp.seek(0)
+
+    model.env.cr.copy_expert('COPY "%s" (%s) FROM STDIN' % (
+        model._table,
+        ', '.join(['"%s"' % field_name for field_name in columns])
+    ), fp)
+    _logger.info("copied %s %s records" % (len(rows), model._name))
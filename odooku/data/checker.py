@@ -0,0 +1,149 @@
+from contextlib import closing
+import logging
+
+from odooku.api import environment
+from odooku.data.serialization.context import SerializationContext
+from odooku.data.serialization.mapping import open_mapping
+from odooku.data.serialization.relations import (
+    ManyToOneSerializer,
+    ManyToManySerializer
+)
+
+from odooku.data.formats import iter_entries
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Types where 0 or False is a value of its own
+VALUED_TYPES = ['boolean', 'integer', 'float', 'monetary']
+
+
+class Checker(object):
+
+    # Validates an export against a database without writing to it.
+    # References must either exist in the database, or belong to an
+    # entry earlier in the file.
+
+    def __init__(self, registry, config, strict=False):
+        self._registry = registry
+        self._config = config
+        self._strict = strict
+        self._defaults = {}
+
+    def _get_defaults(self, serializer, model):
+        if model._name not in self._defaults:
+            self._defaults[model._name] = model.default_get([
+                field_name for (field_name, field) in serializer.fields.iteritems()
+                if field.required
+            ])
+        return self._defaults[model._name]
+
+    def _is_empty(self, field, value):
+        return value is None or (value is False and field.type not in VALUED_TYPES)
+
+    def _missing_required(self, serializer, model, entry):
+        defaults = self._get_defaults(serializer, model)
+        return [
+            field_name for (field_name, field) in serializer.fields.iteritems()
+            if field.required and self._is_empty(
+                model._fields[field_name],
+                entry[field_name] if field_name in entry else defaults.get(field_name, None)
+            )
+        ]
+
+    def _check_entry(self, position, model_name, id, entry, context, seen, pending):
+        if model_name not in context.serializers:
+            return ["Entry %s: model %s does not exist" % (position, model_name)]
+
+        problems = []
+        serializer = context.serializers[model_name]
+        for (field_name, value) in entry.iteritems():
+            field = serializer.fields.get(field_name, None)
+            if field is None:
+                if self._strict:
+                    problems.append("Entry %s: %s has no field %s" % (position, model_name, field_name))
+                continue
+
+            if isinstance(field, ManyToOneSerializer):
+                values = value and [value] or []
+            elif isinstance(field, ManyToManySerializer):
+                values = value or []
+            else:
+                continue
+
+            for value in values:
+                if not seen.get(field.relation, value):
+                    pending.append((field.relation, value, "Entry %s: %s.%s refers to %s %s" % (
+                        position, model_name, field_name, field.relation, value
+                    ), False))
+
+        # Required fields only matter for records that will be created
+        if not seen.get(model_name, id):
+            missing = self._missing_required(serializer, context.env[model_name], entry)
+            if missing:
+                pending.append((model_name, id, "Entry %s: %s %s is missing required fields %s" % (
+                    position, model_name, id, ', '.join(missing)
+                ), True))
+
+        seen.set(model_name, id, True)
+        return problems
+
+    def _resolve(self, pending, context):
+        # Returns the pending checks that don't resolve in the database
+        by_model = {}
+        for item in pending:
+            by_model.setdefault(item[0], []).append(item)
+
+        unresolved = []
+        for (model_name, items) in by_model.iteritems():
+            model = context.env[model_name].with_context(active_test=False)
+            serializer = context.serializers[model_name]
+            ids = serializer.deserialize_ids([id for (_, id, _, _) in items], context)
+            found = set(model.browse([id for id in ids if id]).exists()._ids)
+            unresolved.extend([
+                item for (item, id) in zip(items, ids)
+                if id not in found
+            ])
+        return unresolved
+
+    def check(self, fp):
+        problems = []
+        self._defaults = {}
+        with self._registry.cursor() as cr, \
+                closing(open_mapping(self._config.mapping)) as seen:
+            with environment(cr) as env:
+                context = SerializationContext(
+                    env,
+                    strict=self._strict,
+                    config=self._config
+                )
+
+                pending = []
+                unresolved = []
+                position = 0
+                for entry in iter_entries(fp):
+                    id = entry.pop('__id__')
+                    model_name = entry.pop('__model__')
+                    problems.extend(self._check_entry(position, model_name, id, entry, context, seen, pending))
+                    position += 1
+
+                    if len(pending) >= self._config.chunk_size:
+                        unresolved.extend(self._resolve(pending, context))
+                        pending = []
+
+                unresolved.extend(self._resolve(pending, context))
+                _logger.info("Checked %s entries" % position)
+
+                for (model_name, id, description, required) in unresolved:
+                    if required:
+                        problems.append(description)
+                    elif seen.get(model_name, id):
+                        problems.append("%s, which only comes later" % description)
+                    else:
+                        problems.append("%s, which does not exist" % description)
+
+                # Nothing was written, but don't keep what lookups cached
+                cr.rollback()
+
+        return problems
@@ -1,11 +1,27 @@
 import json
 
 
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_INDEX_LIMIT = 500000
+DEFAULT_BUFFER_SIZE = 64 * 1024 * 1024
+
+
 class DataConfig(object):
 
-    def __init__(self, excludes=None, includes=None, models=None):
+    def __init__(self, excludes=None, includes=None, models=None, chunk_size=None,
+            index_limit=None, buffer_size=None, mapping=None,
+            schema_cache=True):
         self.excludes = excludes or []
         self.includes = includes or []
+        self.chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        self.index_limit = index_limit if index_limit is not None else DEFAULT_INDEX_LIMIT
+        # Bytes held in memory by all export buffers together before
+        # spilling to disk. The ids of buffered records are not counted.
+        self.buffer_size = buffer_size if buffer_size is not None else DEFAULT_BUFFER_SIZE
+        # Id mapping backend, memory or sqlite
+        self.mapping = mapping or 'memory'
+        # Keep parsed model schemas on disk between runs
+        self.schema_cache = schema_cache
         self.models = {
             k: ModelConfig(**v) for
             (k, v) in (models or {}).iteritems()
@@ -28,7 +44,9 @@ class DataConfig(object):
 
 class ModelConfig(object):
 
-    def __init__(self, excludes=None, includes=None, nk=None):
+    def __init__(self, excludes=None, includes=None, nk=None, copy=False):
         self.excludes = excludes or []
         self.includes = includes or []
         self.nk = nk or []
+        # Load new records with COPY instead of the ORM
+        self.copy = copy
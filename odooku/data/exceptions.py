@@ -24,3 +24,11 @@ class LinkNotFound(Exception):
 
 class ModelMissing(Exception):
     pass
+
+
+class ReferenceMissing(Exception):
+    pass
+
+
+class BlobMissing(Exception):
+    pass
@@ -1,16 +1,34 @@
-import json
+from collections import OrderedDict
+from contextlib import closing
+import cPickle
+import itertools
 import logging
+import os
+import tempfile
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools.misc import split_every
 
 from odooku.api import environment
+from odooku.data.blobs import BlobStore
+from odooku.data.buffer import BufferBudget, SpillDict, SpillList
 from odooku.data.serialization.context import SerializationContext
+from odooku.data.serialization.mapping import open_mapping
+from odooku.data.serialization.schema import SchemaCache
 from odooku.data.serialization.dependency import (
     Dependency,
     DependencyGraph,
     DependencyError,
+    sort_nodes,
 )
+from odooku.data.serialization.relations import ManyToOneSerializer
 
+from odooku.data.formats import open_writer, ShardWriter
+from odooku.data.manifest import dump_manifest
 from odooku.data.ids import is_nk, is_link
 from odooku.data.match import match_any
+from odooku.data.scheduler import Scheduler
+from odooku.data.stats import Stats
 from odooku.data.exceptions import (
     NaturalKeyMissing
 )
@@ -19,44 +37,104 @@ from odooku.data.exceptions import (
 _logger = logging.getLogger(__name__)
 
 
+DELAYED_SHARD = '__delayed__'
+
+
 class Exporter(object):
 
-    def __init__(self, registry, config, strict=False, link=False):
+    def __init__(self, registry, config, strict=False, link=False, jobs=1,
+            format='json', compression=None, since=None, blobs=None,
+            watermark=False):
         self._registry = registry
         self._config = config
         self._strict = strict
         self._link = link
+        self._jobs = jobs
+        self._format = format
+        self._compression = compression
+        self._since = since
+        self._blobs = blobs
+        self._watermark = watermark
+        self.watermark = None
+        self.stats = None
+        self.dependencies = None
+        self._budget = None
+        # Set while the iterator is in its delayed pass
+        self.delayed_pass = False
 
     def _begin_write(self, fp):
-        self._fp = fp
-        self._first_entry = True
-        self._fp.write('[')
+        self._writer = open_writer(fp, format=self._format, compression=self._compression)
+        self._writer.begin()
 
     def _end_write(self):
-        self._fp.write(']')
+        self._writer.end()
 
-    def _write(self, model_name, id, values):
-        if not self._first_entry:
-            self._fp.write(',')
-        self._first_entry = False
-        self._fp.write(json.dumps(dict({
+    def _entry(self, model_name, id, values):
+        return dict({
             '__model__': model_name,
             '__id__' : id
-        }, **values), indent=2, separators=(',', ': ')))
+        }, **values)
+
+    def _write(self, model_name, id, values):
+        self._writer.write(self._entry(model_name, id, values))
+
+    def _lookup(self, model):
+        if not self._since:
+            return []
+        if not model._log_access:
+            _logger.info("Model %s has no write date, exporting all records" % model._name)
+            return []
+        return [
+            '|',
+            ('write_date', '>=', self._since),
+            ('create_date', '>=', self._since),
+        ]
+
+    def _get_watermark(self, cr):
+        # Changes made by transactions that are still running carry an
+        # earlier date than they become visible at, don't skip past the
+        # oldest of them. Formatted by the database, Odoo has timestamps
+        # come back as strings.
+        cr.execute("""
+            SELECT to_char(LEAST(now(), (
+                SELECT min(xact_start) FROM pg_stat_activity
+                WHERE datname = current_database()
+            )) AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+        """)
+        return cr.fetchone()[0]
+
+    def _model_dependencies(self, g, order):
+        # Dependencies of each model on the other exported models
+        return OrderedDict([
+            (model_name, set([str(x) for x in g[model_name]]) & set(order) - set([model_name]))
+            for model_name in order
+        ])
 
     def iterator(self, models, context):
         raise NotImplementedError()
 
-    def export(self, fp):
-        self._begin_write(fp)
-        with self._registry.cursor() as cr:
+    def _export(self, write, watermark=False):
+        self.stats = Stats('data.export')
+        # Shared by all buffers of the run
+        self._budget = BufferBudget(self._config.buffer_size)
+        with self._registry.cursor() as cr, \
+                closing(open_mapping(self._config.mapping)) as mapping:
             with environment(cr) as env:
+                if watermark or self._watermark or self._since:
+                    self.watermark = self._get_watermark(cr)
+                if self._since:
+                    _logger.info("Serializing changes since %s" % self._since)
 
+                schema = self._config.schema_cache and SchemaCache.load(env) or None
                 context = SerializationContext(
                     env,
                     strict=self._strict,
                     link=self._link,
-                    config=self._config
+                    config=self._config,
+                    mapping=mapping,
+                    schema=schema,
+                    stats=self.stats,
+                    blobs=BlobStore(self._blobs) if self._blobs else None
                 )
 
                 # Get models to export
@@ -69,75 +147,261 @@ class Exporter(object):
                     )
                 ]
 
+                g = DependencyGraph.from_models(models, context.serializers)
+                self.dependencies = self._model_dependencies(g, [str(x) for x in g.sort()])
+
                 _logger.info("Serializing %s models" % len(models))
+                self.stats.start(cr)
                 for (model_name, id, values) in self.iterator(models, context):
-                    self._write(model_name, id, values)
+                    write(model_name, id, values)
+                    self.stats.record(model_name)
+                self.stats.report()
 
-            self._end_write()
-
-
-class DefaultExporter(Exporter):
-
-    def iterator(self, models, context):
-
-        g = DependencyGraph.from_models(models, context.serializers)
-
-        delayed = []
-        for model_name in [str(x) for x in g.sort()]:
-            model = context.env[model_name].with_context(active_test=False)
-            serializer = context.serializers[model_name]
-            lookup = []
+                if schema:
+                    schema.save()
 
-            count = model.search_count(lookup)
-            if not count:
-                continue
+    def export(self, fp):
+        self._begin_write(fp)
+        self._export(self._write)
+        self._end_write()
+
+    def export_shards(self, path):
+        # A file per model and one for the delayed pass, along with a
+        # manifest of the order they can be imported in.
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        shards = ShardWriter(path, format=self._format, compression=self._compression)
+        current = [None]
+
+        def write(model_name, id, values):
+            shard = self.delayed_pass and DELAYED_SHARD or model_name
+            if shard != current[0]:
+                # Entries of a model are written consecutively
+                if current[0] is not None:
+                    shards.close(current[0])
+                current[0] = shard
+            shards.write(shard, self._entry(model_name, id, values))
+
+        try:
+            self._export(write, watermark=True)
+        finally:
+            shards.close()
+
+        manifest = []
+        for (model_name, dependencies) in self.dependencies.iteritems():
+            if model_name in shards.shards:
+                manifest.append(dict(shards.shards[model_name],
+                    name=model_name,
+                    dependencies=sorted(dependencies & set(shards.shards)),
+                ))
+        if DELAYED_SHARD in shards.shards:
+            # Many2many values can refer to any model
+            manifest.append(dict(shards.shards[DELAYED_SHARD],
+                name=DELAYED_SHARD,
+                dependencies=[shard['name'] for shard in manifest],
+            ))
+
+        dump_manifest(os.path.join(path, 'manifest.json'), {
+            'format': self._format,
+            'compression': self._compression,
+            'since': self._since,
+            'watermark': self.watermark,
+            'shards': manifest,
+        })
 
-            _logger.info("Serializing %s records for model %s" % (count, model_name))
 
-            g = DependencyGraph()
-            entries = dict()
+class DefaultExporter(Exporter):
 
-            for record in model.search(lookup):
-                with context.new_record(model_name, record._ids[0]) as record_context:
-                    serializer = context.serializers[record_context.model_name]
-                    values = serializer.serialize(record, record_context)
+    def _iter_chunks(self, model, lookup, key='id'):
+        # Walk the model in order of a unique key using keyset
+        # pagination, only a single chunk of records is held in memory
+        # at any time.
+        last = -1
+        while True:
+            records = model.search(
+                lookup + [(key, '>', last)],
+                limit=self._config.chunk_size,
+                order=key
+            )
+            if not records:
+                break
+            yield records
+            if key == 'id':
+                last = records._ids[-1]
+            else:
+                last = records[-1:].read([key])[0][key]
+            # Drop the values cached for this chunk
+            model.invalidate_cache()
+
+    def _is_hierarchy(self, model, serializer, lookup):
+        # Ordered by parent_left a parent always comes before its
+        # children, as long as the parent is the only reference to the
+        # model itself and the tree is up to date.
+        if not getattr(model, '_parent_store', False):
+            return False
+        if any([
+                    isinstance(field, ManyToOneSerializer)
+                    and field.relation == model._name
+                    and field_name != model._parent_name
+                    for (field_name, field) in serializer.fields.iteritems()
+                ]):
+            return False
+        return not model.search_count(lookup + [('parent_left', '=', False)])
+
+    def _serialize_model(self, model_name, context, delayed):
+        model = context.env[model_name].with_context(active_test=False)
+        serializer = context.serializers[model_name]
+        lookup = self._lookup(model)
+
+        count = model.search_count(lookup)
+        if not count:
+            return
+
+        _logger.info("Serializing %s records for model %s" % (count, model_name))
+        context.stats.expect(model_name, count)
+
+        hierarchy = self._is_hierarchy(model, serializer, lookup)
+        # Buffered entries along with their edges, only their ids are
+        # kept in memory regardless of the budget.
+        buffered = []
+        entries = SpillDict(self._budget)
+
+        for records in self._iter_chunks(model, lookup, key=hierarchy and 'parent_left' or 'id'):
+            rows = serializer.read(records)
+            serializer.prefetch(rows, context)
+            for row in rows:
+                with context.new_record(model_name, row['id']) as record_context:
+                    values = serializer.serialize(row, record_context)
 
                     try:
                         id = serializer.serialize_id(record_context.id, record_context)
                     except NaturalKeyMissing:
                         id = record_context.id
 
-                    # Add entry to graph
-                    g[record_context.id] = record_context.self_dependencies
-
                     # Either write directly or write later
-                    if not record_context.self_dependencies:
+                    if hierarchy or not record_context.self_dependencies:
                         yield (model_name, id, values)
                     else:
-                        entries[record_context.id] = (model_name, id, values)
+                        buffered.append(record_context.id)
+                        entries[record_context.id] = ((model_name, id, values), [
+                            Dependency(dependency.value, *[field.field_name for field in dependency.fields])
+                            for dependency in record_context.self_dependencies
+                        ])
 
                     if record_context.delayed_fields:
                         if not (is_nk(id) or is_link(id)):
                             raise Exception("Delayed entry cannot work without a natural key or link %s:%s" % (model_name, id))
-                        delayed.append((model_name, record, record_context.delayed_fields))
+                        delayed.append((model_name, record_context.id, tuple(sorted(record_context.delayed_fields))))
+
+        # Write entries in sorted order
+        try:
+            if entries.spilled:
+                _logger.info("Buffered %s records for model %s on disk" % (len(entries), model_name))
+            for id in sort_nodes(buffered, lambda id: entries[id][1]):
+                yield entries[id][0]
+        finally:
+            entries.close()
+
+    def _serialize_delayed(self, delayed, context):
+        _logger.info("Serializing %s delayed records" % len(delayed))
+        # Records of the same model share their delayed fields, read
+        # them in chunks as well.
+        for ((model_name, delayed_fields), group) in itertools.groupby(delayed, key=lambda x: (x[0], x[2])):
+            model = context.env[model_name].with_context(active_test=False)
+            serializer = context.serializers[model_name]
+            for ids in split_every(self._config.chunk_size, [id for (_, id, _) in group]):
+                rows = serializer.read(model.browse(ids), fields=delayed_fields, delayed=True)
+                serializer.prefetch(rows, context, fields=delayed_fields)
+                for row in rows:
+                    with context.new_record(model_name, row['id'], delayed=True) as record_context:
+                        values = serializer.serialize(row, record_context, fields=delayed_fields)
+                        id = serializer.serialize_id(record_context.id, record_context)
+                        yield (model_name, id, values)
+                model.invalidate_cache()
+
+    def iterator(self, models, context):
+        g = DependencyGraph.from_models(models, context.serializers)
 
-            # Sort entries
-            entries = [
-                entries[id]
-                for id in g.sort() if id in entries
-            ]
+        delayed = SpillList(self._budget)
+        self.delayed_pass = False
+        try:
+            for model_name in [str(x) for x in g.sort()]:
+                for entry in self._serialize_model(model_name, context, delayed):
+                    yield entry
 
-            for (model_name, id, values) in entries:
-                yield (model_name, id, values)
+            self.delayed_pass = True
+            for entry in self._serialize_delayed(delayed, context):
+                yield entry
+        finally:
+            delayed.close()
 
-        _logger.info("Serializing %s delayed records" % len(delayed))
-        for (model_name, record, delayed_fields) in delayed:
-            with context.new_record(model_name, record._ids[0], delayed=True) as record_context:
-                serializer = context.serializers[record_context.model_name]
-                values = serializer.serialize(record, record_context, fields=delayed_fields)
-                id = serializer.serialize_id(record_context.id, record_context)
-                yield (model_name, id, values)
+
+class ParallelExporter(DefaultExporter):
+
+    def _export_model(self, model_name, context, snapshot):
+        delayed = SpillList(self._budget)
+        spool = tempfile.TemporaryFile()
+        with self._registry.cursor() as cr:
+            # Must be the first statement of the transaction, Odoo
+            # cursors already run at repeatable read.
+            cr.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+            env = api.Environment(cr, SUPERUSER_ID, context.env.context)
+            for entry in self._serialize_model(model_name, context.with_env(env), delayed):
+                cPickle.dump(entry, spool, cPickle.HIGHEST_PROTOCOL)
+
+        spool.seek(0)
+        return (spool, delayed)
+
+    def iterator(self, models, context):
+        g = DependencyGraph.from_models(models, context.serializers)
+        order = [str(x) for x in g.sort()]
+
+        # Workers can't parse serializers or read the link namespace on
+        # the main cursor, do it now
+        context.serializers.preload(order)
+        if context.link:
+            context.link_namespace
+
+        # All workers read from the snapshot of the main transaction
+        context.env.cr.execute("SELECT pg_export_snapshot()")
+        snapshot = context.env.cr.fetchone()[0]
+
+        # A model can only be serialized once the models it depends on
+        # are done, links are resolved through the shared model map.
+        scheduler = Scheduler(
+            self._model_dependencies(g, order),
+            lambda model_name: self._export_model(model_name, context, snapshot),
+            self._jobs
+        )
+
+        scheduler.start()
+        delayed = SpillList(self._budget)
+        self.delayed_pass = False
+        try:
+            # Write in dependency order, regardless of which model
+            # finished first.
+            for model_name in order:
+                (spool, model_delayed) = scheduler.results[model_name].get()
+                with closing(spool), closing(model_delayed):
+                    while True:
+                        try:
+                            yield cPickle.load(spool)
+                        except EOFError:
+                            break
+                    delayed.extend(model_delayed)
+        finally:
+            scheduler.stop()
+
+        self.delayed_pass = True
+        try:
+            for entry in self._serialize_delayed(delayed, context):
+                yield entry
+        finally:
+            delayed.close()
 
 
 def factory(strategy=None):
+    if strategy == 'parallel':
+        return ParallelExporter
     return DefaultExporter
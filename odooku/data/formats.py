@@ -0,0 +1,244 @@
+from collections import OrderedDict
+import itertools
+import json
+import os
+import zlib
+
+import ijson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_SIZE = 64 * 1024
+
+GZIP_MAGIC = '\x1f\x8b'
+ZSTD_MAGIC = '\x28\xb5\x2f\xfd'
+
+WHITESPACE = ' \t\r\n'
+
+
+class Writer(object):
+
+    def __init__(self, fp, compressor=None):
+        self._fp = fp
+        self._compressor = compressor
+
+    def _write(self, data):
+        if self._compressor:
+            data = self._compressor.compress(data)
+        if data:
+            self._fp.write(data)
+
+    def begin(self):
+        pass
+
+    def write(self, entry):
+        raise NotImplementedError()
+
+    def end(self):
+        if self._compressor:
+            self._fp.write(self._compressor.flush())
+        self._fp.flush()
+
+
+class JSONWriter(Writer):
+
+    def begin(self):
+        self._first_entry = True
+        self._write('[')
+
+    def write(self, entry):
+        if not self._first_entry:
+            self._write(',')
+        self._first_entry = False
+        self._write(json.dumps(entry, indent=2, separators=(',', ': ')))
+
+    def end(self):
+        self._write(']')
+        super(JSONWriter, self).end()
+
+
+class NDJSONWriter(Writer):
+
+    def write(self, entry):
+        self._write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+
+# Puts already consumed data back in front of a stream, allows
+# peeking into streams that can't seek (stdin).
+class PrefixedReader(object):
+
+    def __init__(self, prefix, fp):
+        self._prefix = prefix
+        self._fp = fp
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._fp.read(size)
+
+        if size < 0:
+            data, self._prefix = self._prefix + self._fp.read(), ''
+        else:
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            if len(data) < size:
+                data += self._fp.read(size - len(data))
+        return data
+
+    def readline(self):
+        if not self._prefix:
+            return self._fp.readline()
+
+        index = self._prefix.find('\n')
+        if index < 0:
+            data, self._prefix = self._prefix + self._fp.readline(), ''
+        else:
+            data, self._prefix = self._prefix[:index + 1], self._prefix[index + 1:]
+        return data
+
+
+class DecompressedReader(object):
+
+    def __init__(self, fp, decompressor):
+        self._fp = fp
+        self._decompressor = decompressor
+        self._buffer = ''
+        self._eof = False
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self._fp.read(CHUNK_SIZE)
+            if not data:
+                self._eof = True
+                break
+            self._buffer += self._decompressor.decompress(data)
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self):
+        while True:
+            index = self._buffer.find('\n')
+            if index >= 0 or self._eof:
+                break
+            self._fill(len(self._buffer) + CHUNK_SIZE)
+
+        if index < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:index + 1], self._buffer[index + 1:]
+        return data
+
+
+writers = {
+    'json': JSONWriter,
+    'ndjson': NDJSONWriter,
+}
+
+extensions = {
+    'json': '.json',
+    'ndjson': '.ndjson',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def _compressor(compression):
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(compression)
+
+
+def _decompressor(magic):
+    if magic.startswith(GZIP_MAGIC):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ImportError("zstd compressed input requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+def open_writer(fp, format='json', compression=None):
+    if format not in writers:
+        raise ValueError(format)
+    return writers[format](fp, compressor=compression and _compressor(compression))
+
+
+class ShardWriter(object):
+
+    # Writes entries to a file per shard in a directory, a shard can't
+    # be written to again once it's closed.
+
+    def __init__(self, path, format='json', compression=None):
+        self._path = path
+        self._format = format
+        self._compression = compression
+        self._open = {}
+        self.shards = OrderedDict()
+
+    def write(self, shard, entry):
+        if shard not in self._open:
+            if shard in self.shards:
+                raise ValueError("Shard %s is already closed" % shard)
+            filename = shard + extensions[self._format] + (
+                self._compression and extensions[self._compression] or '')
+            fp = open(os.path.join(self._path, filename), 'wb')
+            writer = open_writer(fp, format=self._format, compression=self._compression)
+            writer.begin()
+            self._open[shard] = (fp, writer)
+            self.shards[shard] = {
+                'file': filename,
+                'entries': 0,
+            }
+
+        self._open[shard][1].write(entry)
+        self.shards[shard]['entries'] += 1
+
+    def close(self, shard=None):
+        for name in (shard and [shard] or self._open.keys()):
+            (fp, writer) = self._open.pop(name)
+            writer.end()
+            fp.close()
+
+
+def iter_entries(fp, skip=0):
+    # Detect compression
+    magic = fp.read(len(ZSTD_MAGIC))
+    fp = PrefixedReader(magic, fp)
+    decompressor = _decompressor(magic)
+    if decompressor:
+        fp = DecompressedReader(fp, decompressor)
+
+    # Detect format, a JSON array or one JSON object per line
+    head = ''
+    while True:
+        char = fp.read(1)
+        head += char
+        if not char or char not in WHITESPACE:
+            break
+    fp = PrefixedReader(head, fp)
+
+    if char == '[':
+        for entry in itertools.islice(ijson.items(fp, 'item'), skip, None):
+            yield entry
+    elif char == '{':
+        for line in iter(fp.readline, ''):
+            if line.strip():
+                # Skipped lines don't need to be parsed
+                if skip:
+                    skip -= 1
+                    continue
+                yield json.loads(line)
+    elif char:
+        raise ValueError("Unrecognized input format")
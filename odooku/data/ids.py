@@ -1,3 +1,6 @@
+import json
+
+
 def hash_id(id):
     if isinstance(id, dict):
         return hash(tuple(sorted(
@@ -6,6 +9,19 @@ def hash_id(id):
     return id
 
 
+def canonical_key(id):
+    # Exact and compact form of an id, natural keys become a sorted
+    # JSON string. Strings are interned, they tend to be repeated.
+    # Parsed floats come in as Decimal, they key as floats.
+    if isinstance(id, dict):
+        id = json.dumps(id, sort_keys=True, separators=(',', ':'), default=float)
+    if isinstance(id, unicode):
+        id = id.encode('utf-8')
+    if isinstance(id, str):
+        return intern(id)
+    return id
+
+
 def is_pk(id):
     return isinstance(id, int)
 
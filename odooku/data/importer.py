@@ -1,8 +1,15 @@
-import ijson
+from collections import OrderedDict
+from contextlib import closing
+import json
 import logging
+import os
+
+from odoo import api, SUPERUSER_ID
 
 from odooku.api import environment
 from odooku.data.serialization.context import SerializationContext
+from odooku.data.serialization.mapping import open_mapping
+from odooku.data.serialization.schema import SchemaCache
 from odooku.data.exceptions import (
     NaturalKeyMultipleFound,
     NaturalKeyNotFound,
@@ -10,33 +17,186 @@ from odooku.data.exceptions import (
     LinkNotFound
 )
 
-from odooku.data.ids import is_nk, is_link
+from odooku.data.blobs import BlobStore
+from odooku.data.bulk import copy_columns, copy_rows, preallocate_ids
+from odooku.data.formats import iter_entries
+from odooku.data.ids import hash_id, is_nk, is_link
+from odooku.data.links import load_links, save_links
+from odooku.data.manifest import load_manifest
 from odooku.data.match import match, match_any
+from odooku.data.pipeline import Pipeline
+from odooku.data.scheduler import Scheduler
+from odooku.data.stats import Stats
 
 
 _logger = logging.getLogger(__name__)
 
 
+# Deferred imports run without tracking, stored computed fields and
+# parent_store are brought up to date in bulk instead of per record.
+DEFERRED_CONTEXT = {
+    'recompute': False,
+    'defer_parent_store_computation': True,
+    'tracking_disable': True,
+    'mail_notrack': True,
+    'mail_create_nolog': True,
+    'mail_create_nosubscribe': True,
+}
+
+
 class Importer(object):
 
-    def __init__(self, registry, config, strict=False):
+    def __init__(self, registry, config, strict=False, batch_size=None,
+            pipeline=False, commit_every=None, checkpoint=None, blobs=None,
+            links=False, defer=False):
         self._registry = registry
         self._config = config
         self._strict = strict
+        self._batch_size = batch_size
+        self._pipeline = pipeline
+        self._commit_every = commit_every
+        self._checkpoint = checkpoint
+        self._blobs = blobs
+        self._links = links
+        self._defer = defer
+        self.stats = None
+        self._copy_models = {}
+        # Mapped since the previous commit
+        self._mapped = []
+        self._checkpoint_fp = None
+        # Models whose parent_store was left behind
+        self._parent_store = set()
+
+    def _map(self, context, model_name, id, value):
+        context.map(model_name, id, value)
+        if self._checkpoint_fp is not None or self._links:
+            self._mapped.append((model_name, id, value))
+
+    def _read_checkpoint(self, context):
+        # A line per commit with what was mapped in between, a torn
+        # last line is of a commit the checkpoint is behind on and is
+        # cut off before appending.
+        position = 0
+        with open(self._checkpoint, 'r+') as fp:
+            end = 0
+            for line in iter(fp.readline, ''):
+                if not line.endswith('\n'):
+                    break
+                try:
+                    checkpoint = json.loads(line)
+                except ValueError:
+                    break
+                position = checkpoint['position']
+                context.load_map(checkpoint['model_map'])
+                end = fp.tell()
+            fp.truncate(end)
+        return position
+
+    def _write_checkpoint(self, position):
+        self._checkpoint_fp.write(json.dumps({
+            'position': position,
+            'model_map': self._mapped,
+        }, default=float) + '\n')
+        self._checkpoint_fp.flush()
+        os.fsync(self._checkpoint_fp.fileno())
 
-    def _deserialize_entry(self, entry, context):
+    def _resolve_existing(self, context):
         model = context.env[context.model_name].with_context(active_test=False)
         serializer = context.serializers[context.model_name]
-        values = serializer.deserialize(entry, context)
-
-        existing = None
         try:
-            existing = serializer.deserialize_id(context.id, context)
-            if not model.browse([existing]).exists():
-                existing = None
+            existing = model.browse([serializer.deserialize_id(context.id, context)]).exists()
+            if existing:
+                return existing
         except (LinkNotFound, NaturalKeyError):
             pass
 
+    def _copy_columns(self, model_name, context):
+        # Columns to COPY into for models configured to, None when the
+        # ORM is used.
+        if model_name not in self._copy_models:
+            columns = None
+            model_config = self._config.models.get(model_name, None)
+            if model_config and model_config.copy:
+                columns = copy_columns(context.env[model_name])
+                if columns is None:
+                    _logger.warning("Model %s can not be loaded with COPY, using the ORM" % model_name)
+            self._copy_models[model_name] = columns
+        return self._copy_models[model_name]
+
+    def _get_batch_size(self, model_name, context):
+        if self._batch_size:
+            return self._batch_size
+        if self._copy_columns(model_name, context) is not None:
+            return self._config.chunk_size
+
+    def _copy_batch(self, batch, columns, context):
+        model_name = batch[0][0]
+        model = context.env[model_name].with_context(active_test=False)
+        serializer = context.serializers[model_name]
+
+        rows = []
+        row_ids = []
+        fallback = []
+        for (_, id, entry) in batch:
+            with context.new_entry(model_name, id) as entry_context:
+                values = serializer.deserialize(entry, entry_context)
+            if set(values) <= set(columns):
+                rows.append(values)
+                row_ids.append(id)
+            else:
+                fallback.append((id, entry))
+
+        if rows:
+            # Only rows that are copied get an id
+            for (values, id, new_id) in zip(rows, row_ids, preallocate_ids(model, len(rows))):
+                values['id'] = new_id
+                if is_link(id):
+                    self._map(context, model_name, id, new_id)
+            copy_rows(model, columns, rows)
+            serializer.index_ids([values['id'] for values in rows], context)
+
+        for (id, entry) in fallback:
+            with context.new_entry(model_name, id) as entry_context:
+                self._deserialize_entry(entry, entry_context)
+
+    def _deserialize_batch(self, batch, context):
+        # Consecutive entries of a single model, resolve all of
+        # their ids at once.
+        model_name = batch[0][0]
+        model = context.env[model_name].with_context(active_test=False)
+        serializer = context.serializers[model_name]
+
+        ids = serializer.deserialize_ids([id for (_, id, _) in batch], context)
+        # Iterating keeps the records prefetched together
+        found = dict([
+            (record.id, record)
+            for record in model.browse([id for id in ids if id]).exists()
+        ])
+
+        columns = self._copy_columns(model_name, context)
+        if columns is not None:
+            new = [
+                entry for (entry, existing) in zip(batch, ids)
+                if existing not in found
+            ]
+            if new:
+                self._copy_batch(new, columns, context)
+                (batch, ids) = zip(*[
+                    (entry, existing) for (entry, existing) in zip(batch, ids)
+                    if existing in found
+                ]) or ([], [])
+
+        for ((model_name, id, entry), existing) in zip(batch, ids):
+            with context.new_entry(model_name, id) as entry_context:
+                self._deserialize_entry(entry, entry_context,
+                    existing=found.get(existing, None))
+
+        self._recompute(model_name, context)
+
+    def _deserialize_entry(self, entry, context, existing=None):
+        model = context.env[context.model_name].with_context(active_test=False)
+        serializer = context.serializers[context.model_name]
+        values = serializer.deserialize(entry, context)
 
         if not existing:
             # Create new model
@@ -48,47 +208,272 @@ class Importer(object):
                 raise
 
             if is_link(context.id):
-                context.map(context.model_name, context.id, new_id)
+                self._map(context, context.model_name, context.id, new_id)
 
+            # Deferred, a new record has no place in the tree yet
+            self._parent_store_pending(model, created=True)
+
+            serializer.index_id(new_id, context)
             if is_nk(context.id):
                 try:
                     serializer.deserialize_id(context.id, context)
                 except NaturalKeyNotFound:
                     _logger.warning("Natural key %s for %s:%s is no longer valid, updating" % (context.id, context.model_name, new_id))
                     model.browse([new_id])[0].write(serializer.deserialize_id(context.id, context, no_lookup=True))
+                    serializer.index_id(new_id, context)
                     try:
                         serializer.deserialize_id(context.id, context)
                     except NaturalKeyNotFound:
                         _logger.warning("Natural key %s for %s:%s is no longer valid, remapping" % (context.id, context.model_name, new_id))
-                        context.map(context.model_name, context.id, new_id)
+                        self._map(context, context.model_name, context.id, new_id)
         else:
+            values = self._changed_values(existing, values)
+            if not values:
+                _logger.debug("unchanged %s %s" % (context.model_name, existing.id))
+                return
             try:
-                model.browse([existing])[0].write(values)
-                _logger.info("updated %s %s" % (context.model_name, existing))
+                existing.write(values)
+                self._parent_store_pending(model, created=False, values=values)
+                _logger.info("updated %s %s" % (context.model_name, existing.id))
+                if set(values) & set(serializer.nk):
+                    serializer.index_id(existing.id, context)
             except Exception:
-                _logger.warning("%s %s %s" % (context.model_name, existing, values))
+                _logger.warning("%s %s %s" % (context.model_name, existing.id, values))
                 raise
 
+    def _changed_values(self, record, values):
+        # Writing values a record already has still triggers recomputes,
+        # tracking and constraints, leave them out.
+        changed = {}
+        for (field_name, value) in values.iteritems():
+            field = record._fields[field_name]
+            try:
+                value = field.convert_to_record(field.convert_to_cache(value, record, validate=False), record)
+            except Exception:
+                # Not comparable, write it anyway
+                changed[field_name] = values[field_name]
+                continue
+            if value != record[field_name]:
+                changed[field_name] = values[field_name]
+        return changed
 
-    def import_(self, fp, fake=False):
-        with self._registry.cursor() as cr:
+    def _recompute(self, model_name, context):
+        if self._defer:
+            context.env[model_name].recompute()
+
+    def _parent_store_pending(self, model, created, values=None):
+        # Creating always leaves parent_store behind, updating only when
+        # the parent changes.
+        if self._defer and getattr(model, '_parent_store', False) and (
+                    created or model._parent_name in values
+                ):
+            self._parent_store.add(model._name)
+
+    def _compute_parent_store(self, model_name, context):
+        # Renumbers the whole table, only once a model is done
+        _logger.info("Computing parent_store of %s" % model_name)
+        context.env[model_name]._parent_store_compute()
+        self._parent_store.discard(model_name)
+
+    def _commit(self, context, position):
+        cr = context.env.cr
+        if self._links:
+            save_links(cr, self._mapped)
+        cr.execute('RELEASE SAVEPOINT import_save')
+        cr.commit()
+        if self._checkpoint_fp is not None:
+            # Written after the commit, the checkpoint is only ever
+            # behind on what has been committed.
+            self._write_checkpoint(position)
+        self._mapped = []
+        _logger.info("Committed %s entries" % position)
+        cr.execute('SAVEPOINT import_save')
+
+    def _import_entries(self, entries, context, position=0, commit=False):
+        batch = []
+        batch_ids = set()
+        committed = position
+        previous = None
+
+        for entry in entries:
+            id = entry.pop('__id__')
+            model_name = entry.pop('__model__')
+            batch_size = self._get_batch_size(model_name, context)
+
+            # An entry can only be batched with entries of the same
+            # model, and not with an earlier entry for the same id.
+            if batch and (
+                        batch[0][0] != model_name
+                        or len(batch) >= batch_size
+                        or hash_id(id) in batch_ids
+                    ):
+                self._deserialize_batch(batch, context)
+                position += len(batch)
+                self.stats.record(batch[0][0], len(batch))
+                batch = []
+                batch_ids = set()
+
+            if model_name != previous:
+                # Done with the previous model
+                if previous and not self._get_batch_size(previous, context):
+                    self._recompute(previous, context)
+                if previous in self._parent_store:
+                    self._compute_parent_store(previous, context)
+                previous = model_name
+
+            if not batch_size:
+                with context.new_entry(model_name, id) as entry_context:
+                    self._deserialize_entry(entry, entry_context,
+                        existing=self._resolve_existing(entry_context))
+                position += 1
+                self.stats.record(model_name)
+            else:
+                batch.append((model_name, id, entry))
+                batch_ids.add(hash_id(id))
+
+            if commit and position - committed >= self._commit_every:
+                if not batch_size:
+                    self._recompute(model_name, context)
+                self._commit(context, position)
+                committed = position
+
+        if batch:
+            self._deserialize_batch(batch, context)
+            position += len(batch)
+            self.stats.record(batch[0][0], len(batch))
+        elif previous:
+            self._recompute(previous, context)
+        if previous in self._parent_store:
+            self._compute_parent_store(previous, context)
+
+        if commit and position > committed:
+            self._commit(context, position)
+
+    def _new_context(self, env, mapping, schema):
+        if self._defer:
+            env = env(context=dict(env.context, **DEFERRED_CONTEXT))
+        return SerializationContext(
+            env,
+            strict=self._strict,
+            config=self._config,
+            mapping=mapping,
+            schema=schema,
+            stats=self.stats,
+            blobs=BlobStore(self._blobs) if self._blobs else None
+        )
+
+    def import_(self, fp, fake=False, resume=False):
+        self.stats = Stats('data.import')
+        self._mapped = []
+        self._parent_store = set()
+        commit = bool(self._commit_every and not fake)
+        with self._registry.cursor() as cr, \
+                closing(open_mapping(self._config.mapping)) as mapping:
             with environment(cr) as env:
-                context = SerializationContext(
-                    env,
-                    strict=self._strict,
-                    config=self._config
-                )
+                schema = self._config.schema_cache and SchemaCache.load(env) or None
+                context = self._new_context(env, mapping, schema)
+                if self._links:
+                    context.load_map(load_links(env))
+
+                position = 0
+                resuming = resume and self._checkpoint and os.path.exists(self._checkpoint)
+                if resuming:
+                    position = self._read_checkpoint(context)
+                    _logger.info("Resuming after %s entries" % position)
+                elif resume:
+                    # Also what is left of an import that completed
+                    _logger.warning("Checkpoint %s does not exist, importing from the first entry" % self._checkpoint)
+                if commit and self._checkpoint:
+                    self._checkpoint_fp = open(self._checkpoint, resuming and 'a' or 'w')
 
+                entries = iter_entries(fp, skip=position)
+                if self._pipeline:
+                    # Parse ahead while the database is busy
+                    entries = pipeline = Pipeline(entries, self._config.chunk_size)
+
+                self.stats.start(cr)
                 try:
                     cr.execute('SAVEPOINT import_save')
-                    for entry in ijson.items(fp, 'item'):
-                        id = entry.pop('__id__')
-                        model_name = entry.pop('__model__')
-                        with context.new_entry(model_name, id) as entry_context:
-                            self._deserialize_entry(entry, entry_context)
+                    # A fake import is rolled back as a whole
+                    self._import_entries(entries, context, position=position,
+                        commit=commit)
+                    if self._links:
+                        save_links(cr, self._mapped)
                 except Exception:
                     cr.execute('ROLLBACK TO SAVEPOINT import_save')
                     raise
+                finally:
+                    if self._checkpoint_fp is not None:
+                        self._checkpoint_fp.close()
+                        self._checkpoint_fp = None
+                    if self._pipeline:
+                        pipeline.report('parsed', 'written')
+                    self.stats.report()
+
+                if commit and self._checkpoint:
+                    # Done, a later resume must not skip into another input
+                    os.unlink(self._checkpoint)
+
+                if schema:
+                    schema.save()
 
                 if fake:
                     cr.execute('ROLLBACK TO SAVEPOINT import_save')
+
+    def _import_shard(self, path, shard, context):
+        with self._registry.cursor() as cr:
+            # The worker greenlet has environments of its own
+            env = api.Environment(cr, SUPERUSER_ID, context.env.context)
+            with open(os.path.join(path, shard['file']), 'rb') as fp:
+                self._import_entries(iter_entries(fp), context.with_env(env))
+        _logger.info("Imported shard %s" % shard['name'])
+
+    def import_shards(self, path, jobs=1):
+        # Shards are imported on cursors of their own once the shards
+        # they depend on are committed, links are resolved through the
+        # shared mapping.
+        manifest = load_manifest(os.path.join(path, 'manifest.json'))
+        shards = OrderedDict([
+            (shard['name'], shard)
+            for shard in manifest['shards']
+        ])
+
+        self.stats = Stats('data.import')
+        self._mapped = []
+        self._parent_store = set()
+        with self._registry.cursor() as cr, \
+                closing(open_mapping(self._config.mapping)) as mapping:
+            with environment(cr) as env:
+                schema = self._config.schema_cache and SchemaCache.load(env) or None
+                context = self._new_context(env, mapping, schema)
+                if self._links:
+                    context.load_map(load_links(env))
+
+                # Workers can't parse serializers on the main cursor
+                context.serializers.preload([
+                    name for name in shards
+                    if name in context.serializers
+                ])
+
+                scheduler = Scheduler(
+                    OrderedDict([
+                        (name, shard['dependencies'])
+                        for (name, shard) in shards.iteritems()
+                    ]),
+                    lambda name: self._import_shard(path, shards[name], context),
+                    jobs
+                )
+
+                self.stats.start(cr)
+                scheduler.start()
+                try:
+                    for name in shards:
+                        scheduler.results[name].get()
+                    if self._links:
+                        save_links(cr, self._mapped)
+                finally:
+                    scheduler.stop()
+                    self.stats.report()
+
+                if schema:
+                    schema.save()
@@ -0,0 +1,75 @@
+from cStringIO import StringIO
+import logging
+
+from odooku.data.bulk import _copy_value
+from odooku.data.ids import is_link
+
+
+_logger = logging.getLogger(__name__)
+
+
+LINK_TABLE = 'odooku_data_link'
+
+
+def ensure_table(cr):
+    cr.execute("""
+        CREATE TABLE IF NOT EXISTS %s (
+            model varchar NOT NULL,
+            link varchar NOT NULL,
+            res_id integer NOT NULL,
+            PRIMARY KEY (model, link)
+        )
+    """ % LINK_TABLE)
+
+
+def load_links(env):
+    # Links of earlier imports whose records still exist
+    ensure_table(env.cr)
+    env.cr.execute("SELECT DISTINCT model FROM %s" % LINK_TABLE)
+    rows = []
+    for (model_name,) in env.cr.fetchall():
+        if model_name not in env.registry or not env[model_name]._auto:
+            continue
+        env.cr.execute('SELECT l.link, l.res_id FROM %s l JOIN "%s" t ON t.id = l.res_id WHERE l.model = %%s' % (
+            LINK_TABLE, env[model_name]._table
+        ), (model_name,))
+        rows.extend([
+            (model_name, link, res_id)
+            for (link, res_id) in env.cr.fetchall()
+        ])
+    _logger.info("Loaded %s links of earlier imports" % len(rows))
+    return rows
+
+
+def save_links(cr, rows):
+    # Rows mapped since the previous save, only links onto ids are
+    # kept and the last mapping of a link wins.
+    links = dict([
+        ((model_name, key), value)
+        for (model_name, key, value) in rows
+        if is_link(key) and isinstance(value, (int, long))
+    ])
+    fp = StringIO()
+    for ((model_name, key), value) in links.iteritems():
+        fp.write('\t'.join([_copy_value(model_name), _copy_value(key), _copy_value(value)]))
+        fp.write('\n')
+    fp.seek(0)
+    count = len(links)
+
+    ensure_table(cr)
+    cr.execute("CREATE TEMPORARY TABLE odooku_data_link_new (model varchar, link varchar, res_id integer)")
+    cr.copy_expert("COPY odooku_data_link_new (model, link, res_id) FROM STDIN", fp)
+    cr.execute("""
+        UPDATE %(table)s l SET res_id = n.res_id
+        FROM odooku_data_link_new n
+        WHERE l.model = n.model AND l.link = n.link AND l.res_id != n.res_id
+    """ % {'table': LINK_TABLE})
+    cr.execute("""
+        INSERT INTO %(table)s (model, link, res_id)
+        SELECT n.model, n.link, n.res_id FROM odooku_data_link_new n
+        WHERE NOT EXISTS (
+            SELECT 1 FROM %(table)s l WHERE l.model = n.model AND l.link = n.link
+        )
+    """ % {'table': LINK_TABLE})
+    cr.execute("DROP TABLE odooku_data_link_new")
+    _logger.info("Saved %s links" % count)
@@ -0,0 +1,25 @@
+import datetime
+import json
+import os
+
+from odoo.tools.misc import DEFAULT_SERVER_DATETIME_FORMAT
+
+
+def load_manifest(path):
+    with open(path, 'r') as fp:
+        return json.load(fp)
+
+
+def dump_manifest(path, manifest):
+    # Replaced atomically, a failed run leaves the previous one intact
+    with open(path + '.tmp', 'w') as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def read_watermark(value):
+    # Either a timestamp, or the manifest of a previous export
+    if os.path.isfile(value):
+        value = load_manifest(value)['watermark']
+    datetime.datetime.strptime(value, DEFAULT_SERVER_DATETIME_FORMAT)
+    return value
@@ -0,0 +1,78 @@
+import logging
+import sys
+import time
+
+import gevent
+from gevent.queue import Queue
+
+
+_logger = logging.getLogger(__name__)
+
+
+DONE = object()
+
+
+class Pipeline(object):
+
+    def __init__(self, iterable, size):
+        self._iterable = iterable
+        self._queue = Queue(maxsize=size)
+        self.produced = 0
+        self.consumed = 0
+        # Time spent producing items, and waiting on a full queue
+        self.produce_time = 0.0
+        self.produce_stall = 0.0
+        # Time spent consuming items, and waiting on an empty queue
+        self.consume_time = 0.0
+        self.consume_stall = 0.0
+
+    def _produce(self):
+        try:
+            iterator = iter(self._iterable)
+            while True:
+                start = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.produce_time += time.time() - start
+                self.produced += 1
+
+                start = time.time()
+                self._queue.put((item, None))
+                self.produce_stall += time.time() - start
+                # Parsing never waits on io, give the consumer a
+                # chance to run.
+                gevent.sleep(0)
+        except Exception:
+            self._queue.put((DONE, sys.exc_info()))
+        else:
+            self._queue.put((DONE, None))
+
+    def __iter__(self):
+        producer = gevent.spawn(self._produce)
+        try:
+            while True:
+                start = time.time()
+                (item, exc_info) = self._queue.get()
+                self.consume_stall += time.time() - start
+                if item is DONE:
+                    if exc_info:
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    break
+
+                start = time.time()
+                yield item
+                self.consume_time += time.time() - start
+                self.consumed += 1
+        finally:
+            producer.kill()
+
+    def report(self, producer='produced', consumer='consumed'):
+        for (name, count, busy, stall) in [
+                    (producer, self.produced, self.produce_time, self.produce_stall),
+                    (consumer, self.consumed, self.consume_time, self.consume_stall),
+                ]:
+            _logger.info("%s %s entries at %.1f/s, busy %.1fs, stalled %.1fs" % (
+                name.capitalize(), count, count / busy if busy else 0.0, busy, stall
+            ))
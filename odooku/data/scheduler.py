@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.pool import Pool
+from gevent.queue import Queue
+
+
+class Scheduler(object):
+
+    # Runs a job per key once the jobs it depends on are done, at most
+    # size at a time. When a job fails, whatever is still pending fails
+    # with the same error.
+
+    def __init__(self, dependencies, target, size):
+        self._pending = OrderedDict([
+            (key, set(keys))
+            for (key, keys) in dependencies.iteritems()
+        ])
+        self._target = target
+        self._pool = Pool(size)
+        self._finished = Queue()
+        self._greenlet = None
+        self.results = dict([
+            (key, AsyncResult())
+            for key in self._pending
+        ])
+
+    def _run(self, key):
+        try:
+            self.results[key].set(self._target(key))
+        except Exception as ex:
+            self.results[key].set_exception(ex)
+        self._finished.put(key)
+
+    def _schedule(self):
+        pending = self._pending
+        while pending:
+            for key in [
+                        key
+                        for (key, dependencies) in pending.iteritems()
+                        if not dependencies
+                    ]:
+                del pending[key]
+                self._pool.spawn(self._run, key)
+
+            if pending:
+                done = self._finished.get()
+                if not self.results[done].successful():
+                    for key in pending.iterkeys():
+                        self.results[key].set_exception(self.results[done].exception)
+                    return
+                for dependencies in pending.itervalues():
+                    dependencies.discard(done)
+
+    def start(self):
+        self._greenlet = gevent.spawn(self._schedule)
+
+    def stop(self):
+        if self._greenlet is not None:
+            self._greenlet.kill()
+        self._pool.kill()
@@ -4,7 +4,7 @@ class BaseFieldSerializer(object):
         self.field_name = field_name
         self.required = required
 
-    def serialize(self, record, context):
+    def serialize(self, row, context):
         raise NotImplementedError()
 
     def deserialize(self, record, context):
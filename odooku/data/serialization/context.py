@@ -1,60 +1,85 @@
-from collections import OrderedDict
 import logging
+import uuid
 
 from odooku.data.serialization.dependency import Dependency
-from odooku.data.serialization.model import ModelSerializer
-from odooku.data.ids import hash_id
-
-model_map = {}
-missing_nks = {}
+from odooku.data.serialization.index import NaturalKeyIndex
+from odooku.data.serialization.mapping import MappingStore
+from odooku.data.serialization.schema import SerializerMap
+from odooku.data.ids import canonical_key
+from odooku.data.stats import Stats
 
 _logger = logging.getLogger(__name__)
 
 
 class SerializationContext(object):
 
-    def __init__(self, env, config, strict=False, link=False):
+    def __init__(self, env, config, strict=False, link=False, mapping=None,
+            schema=None, stats=None, blobs=None):
         self.env = env
         self.config = config
+        self.schema = schema
+        self.blobs = blobs
+        self.stats = stats if stats is not None else Stats('data')
         self.strict = strict
         self.link = link
+        self.mapping = mapping if mapping is not None else MappingStore()
+        self.missing_nks = {}
+        self.nk_cache = {}
+        self.nk_indexes = {}
         self._serializers = None
+        self._link_namespace = None
 
     @property
     def serializers(self):
         if self._serializers is None:
-            self._serializers = OrderedDict([
-                (model_name, ModelSerializer.parse(
-                    model_name,
-                    self.env[model_name], # use iterkeys instead of env iteritems for Odoo 9 compatibiltiy,
-                    config=self.config
-                ))
-                for model_name in self.env.registry.iterkeys()
-                if not any([
-                    # use getattr for Odoo 9 compatibility
-                    getattr(self.env[model_name], attr, False)
-                    for attr in ['_transient', '_abstract']
-                ])
-            ])
-
+            self._serializers = SerializerMap(self.env, self.config, schema=self.schema)
         return self._serializers
 
+    @property
+    def link_namespace(self):
+        # Links are derived from the database uuid, a record keeps its
+        # link across exports.
+        if self._link_namespace is None:
+            self._link_namespace = uuid.UUID(
+                self.env['ir.config_parameter'].sudo().get_param('database.uuid')
+            )
+        return self._link_namespace
+
     def _clone(self, cls=None):
         cls = cls or type(self)
-        clone = cls(self.env, strict=self.strict, link=self.link, config=self.config)
+        clone = cls(self.env, strict=self.strict, link=self.link, config=self.config,
+            mapping=self.mapping, schema=self.schema, stats=self.stats,
+            blobs=self.blobs)
         clone._serializers = self.serializers
+        clone.missing_nks = self.missing_nks
+        clone.nk_cache = self.nk_cache
+        clone.nk_indexes = self.nk_indexes
+        if self.link:
+            clone._link_namespace = self.link_namespace
+        return clone
+
+    def with_env(self, env):
+        clone = self._clone()
+        clone.env = env
         return clone
 
     def register_nk(self, model_name, nk):
         if (self.config.includes and model_name not in self.config.includes
                     or self.config.excludes and model_name in self.config.excludes
                 ):
-            if model_name not in missing_nks:
-                missing_nks[model_name] = []
+            if model_name not in self.missing_nks:
+                self.missing_nks[model_name] = set()
 
-            if nk not in missing_nks[model_name]:
+            key = canonical_key(nk)
+            if key not in self.missing_nks[model_name]:
                 _logger.info("Natural key %s for model %s required on import" % (nk, model_name))
-                missing_nks[model_name].append(nk)
+                self.missing_nks[model_name].add(key)
+
+    def nk_index(self, serializer):
+        # Built on first use, None when the model is too large
+        if serializer.model_name not in self.nk_indexes:
+            self.nk_indexes[serializer.model_name] = NaturalKeyIndex.build(serializer, self)
+        return self.nk_indexes[serializer.model_name]
 
     def new_entry(self, model_name, id=None):
         clone = self._clone(EntryContext)
@@ -70,14 +95,19 @@ class SerializationContext(object):
         return clone
 
     def resolve(self, model_name, a):
-        if model_name in model_map:
-            return model_map[model_name].get(hash_id(a), None)
+        return self.mapping.get(model_name, a)
 
     def map(self, model_name, a, b):
-        if model_name not in model_map:
-            model_map[model_name] = {}
+        self.mapping.set(model_name, a, b)
+
+    def dump_map(self):
+        return [
+            [model_name, key, value]
+            for (model_name, key, value) in self.mapping.dump()
+        ]
 
-        model_map[model_name][hash_id(a)] = b
+    def load_map(self, entries):
+        self.mapping.load(entries)
 
 
 class RecordContext(SerializationContext):
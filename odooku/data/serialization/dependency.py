@@ -50,6 +50,44 @@ class DependencyError(Exception):
         return "Cyclic dependency detected %s" % " -> ".join(path)
 
 
+def sort_nodes(nodes, get_edges):
+    # Depth first, visiting nodes and their dependencies in initial
+    # order where possible. Dependencies are matched by value, map
+    # them onto the actual nodes. Edges are only asked for once per
+    # node, they need not be kept in memory.
+    order = nodes
+    nodes = dict([(node, node) for node in order])
+    done = set()
+
+    for root in order:
+        if root in done:
+            continue
+
+        # Keep the current path in order to detect cyclic dependencies
+        path = [root]
+        visiting = set([root])
+        stack = [(root, iter(get_edges(root)))]
+        while stack:
+            (node, edges) = stack[-1]
+            for edge in edges:
+                m = nodes.get(edge, None)
+                if m is None or m in done:
+                    continue
+                if m in visiting:
+                    raise DependencyError(path[path.index(m):] + [edge])
+                path.append(edge)
+                visiting.add(m)
+                stack.append((m, iter(get_edges(m))))
+                break
+            else:
+                # No dependencies left, output
+                stack.pop()
+                path.pop()
+                visiting.remove(node)
+                done.add(node)
+                yield node
+
+
 class DependencyGraph(OrderedDict):
 
     def __getitem__(self, key):
@@ -71,34 +109,7 @@ class DependencyGraph(OrderedDict):
         return g
 
     def sort(self):
-
-        incomming = OrderedDict([
-            (node, list(edges)) for node, edges in self.iteritems()
-        ])
-
-        # Try to output nodes in initial order
-        nodes = [node for node in incomming.iterkeys()]
-        # Keep a stack in order to detect cyclic dependencies
-
-        stack = []
-        while nodes:
-            # Get first node
-            n = nodes[0]
-            # See if this node has dependencies which haven't yet been
-            # outputted.
-            remaining = [node for node in reversed(incomming[n]) if node in nodes]
-            if remaining:
-                if n not in stack:
-                    stack.append(n)
-                else:
-                    raise DependencyError(stack + [n])
-                for m in remaining:
-                    # Place dependency at front
-                    nodes.remove(m)
-                    nodes.insert(0, m)
-            else:
-                # No dependencies left, output
-                yield nodes.pop(0)
+        return sort_nodes(list(self.iterkeys()), self.__getitem__)
 
     @classmethod
     def from_models(cls, models, serializers):
@@ -1,10 +1,30 @@
+import base64
+
 from odooku.data.serialization.base import BaseFieldSerializer
+from odooku.data.exceptions import BlobMissing
 
 
 class FieldSerializer(BaseFieldSerializer):
 
-    def serialize(self, record, context):
-        return record.read([self.field_name])[0][self.field_name]
+    def serialize(self, row, context):
+        return row[self.field_name]
 
     def deserialize(self, values, context):
         return values[self.field_name]
+
+
+class BinaryFieldSerializer(FieldSerializer):
+
+    def serialize(self, row, context):
+        value = row[self.field_name]
+        if value and context.blobs is not None:
+            return {'__blob__': context.blobs.put(base64.b64decode(value))}
+        return value
+
+    def deserialize(self, values, context):
+        value = values[self.field_name]
+        if isinstance(value, dict) and '__blob__' in value:
+            if context.blobs is None:
+                raise BlobMissing("Field %s refers to blob %s, no blob directory given" % (self.field_name, value['__blob__']))
+            return base64.b64encode(context.blobs.get(value['__blob__']))
+        return value
@@ -0,0 +1,72 @@
+import logging
+
+from odoo.tools.misc import split_every
+
+from odooku.data.exceptions import NaturalKeyMultipleFound
+
+
+_logger = logging.getLogger(__name__)
+
+
+class NaturalKeyIndex(object):
+
+    def __init__(self, model_name, max_id=0):
+        self.model_name = model_name
+        # Records created after building the index are not guaranteed
+        # to be in it.
+        self.max_id = max_id
+        # Maps keys onto an id, or a set of ids when not unique
+        self._keys = {}
+        self._ids = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, id, key):
+        self.discard(id)
+        self._ids[id] = key
+        existing = self._keys.get(key, None)
+        if existing is None:
+            self._keys[key] = id
+        elif isinstance(existing, set):
+            existing.add(id)
+        elif existing != id:
+            self._keys[key] = set([existing, id])
+
+    def discard(self, id):
+        key = self._ids.pop(id, None)
+        if key is None:
+            return
+
+        existing = self._keys[key]
+        if isinstance(existing, set):
+            existing.discard(id)
+            if len(existing) == 1:
+                self._keys[key] = existing.pop()
+        else:
+            del self._keys[key]
+
+    def lookup(self, key):
+        id = self._keys.get(key, None)
+        if isinstance(id, set):
+            raise NaturalKeyMultipleFound("%s records found for model %s with natural key %s" % (len(id), self.model_name, key))
+        return id
+
+    @classmethod
+    def build(cls, serializer, context):
+        model = context.env[serializer.model_name].with_context(active_test=False)
+        count = model.search_count([])
+        if count > context.config.index_limit:
+            _logger.info("Not indexing natural keys for model %s, %s records exceed the limit" % (serializer.model_name, count))
+            return None
+
+        ids = model.search([], order='id')._ids
+        index = cls(serializer.model_name, max_id=ids and ids[-1] or 0)
+        for chunk in split_every(context.config.chunk_size, ids):
+            records = model.browse(chunk)
+            for row in serializer.read(records, fields=serializer.nk):
+                index.add(row['id'], serializer.nk_key(row))
+            records.invalidate_cache(fnames=serializer.nk, ids=list(chunk))
+
+        _logger.info("Indexed %s natural keys for model %s" % (len(index), serializer.model_name))
+        return index
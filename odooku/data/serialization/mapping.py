@@ -0,0 +1,99 @@
+import logging
+import os
+import sqlite3
+import tempfile
+
+from odooku.data.ids import canonical_key
+
+
+_logger = logging.getLogger(__name__)
+
+
+class MappingStore(object):
+
+    # Maps ids of a single export or import run onto their counterpart,
+    # pks onto links on export and links or natural keys onto pks on
+    # import.
+
+    def __init__(self):
+        self._models = {}
+
+    def get(self, model_name, id):
+        values = self._models.get(model_name, None)
+        if values is not None:
+            return values.get(canonical_key(id), None)
+
+    def set(self, model_name, id, value):
+        if model_name not in self._models:
+            self._models[model_name] = {}
+        self._models[model_name][canonical_key(id)] = canonical_key(value)
+
+    def dump(self):
+        for (model_name, values) in self._models.iteritems():
+            for (key, value) in values.iteritems():
+                yield (model_name, key, value)
+
+    def load(self, rows):
+        for (model_name, key, value) in rows:
+            if model_name not in self._models:
+                self._models[model_name] = {}
+            self._models[model_name][canonical_key(key)] = canonical_key(value)
+
+    def close(self):
+        self._models = {}
+
+
+class SQLiteMappingStore(MappingStore):
+
+    # Keeps the mapping in a temporary database, for runs too large to
+    # hold it in memory.
+
+    def __init__(self):
+        (fd, self._path) = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self._db = sqlite3.connect(self._path)
+        self._db.text_factory = str
+        # Nothing here needs to survive a crash
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        # Untyped columns keep pks as integers and links as text
+        self._db.execute("CREATE TABLE mapping (model, key, value, PRIMARY KEY (model, key))")
+
+    def get(self, model_name, id):
+        row = self._db.execute(
+            "SELECT value FROM mapping WHERE model = ? AND key = ?",
+            (model_name, canonical_key(id))
+        ).fetchone()
+        return row and row[0] or None
+
+    def set(self, model_name, id, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO mapping (model, key, value) VALUES (?, ?, ?)",
+            (model_name, canonical_key(id), canonical_key(value))
+        )
+
+    def dump(self):
+        return self._db.execute("SELECT model, key, value FROM mapping")
+
+    def load(self, rows):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO mapping (model, key, value) VALUES (?, ?, ?)",
+            ((model_name, canonical_key(key), canonical_key(value))
+                for (model_name, key, value) in rows)
+        )
+
+    def close(self):
+        self._db.close()
+        os.unlink(self._path)
+
+
+stores = {
+    'memory': MappingStore,
+    'sqlite': SQLiteMappingStore,
+}
+
+
+def open_mapping(backend='memory'):
+    if backend not in stores:
+        raise ValueError(backend)
+    return stores[backend]()
@@ -1,8 +1,11 @@
 from collections import OrderedDict
+from decimal import Decimal
 import uuid
 import logging
 
-from odooku.data.serialization.fields import FieldSerializer
+from odoo.osv import expression
+
+from odooku.data.serialization.fields import FieldSerializer, BinaryFieldSerializer
 from odooku.data.exceptions import (
     NaturalKeyError,
     NaturalKeyMultipleFound,
@@ -14,6 +17,7 @@ from odooku.data.exceptions import (
 )
 
 from odooku.data.serialization.relations import (
+    RelationSerializer,
     ManyToOneSerializer,
     ManyToManySerializer
 )
@@ -24,13 +28,48 @@ from odooku.data.match import match, match_any
 
 field_types = {
     'many2one': ManyToOneSerializer,
-    'many2many': ManyToManySerializer
+    'many2many': ManyToManySerializer,
+    'binary': BinaryFieldSerializer
 }
 
 excluded_field_types = [
     'one2many'
 ]
 
+# Column types read straight from the table, their values convert the
+# same way the ORM converts them.
+sql_field_types = [
+    'boolean',
+    'integer',
+    'float',
+    'char',
+    'text',
+    'selection',
+    'date',
+    'datetime',
+    'many2one'
+]
+
+# Field attributes the serializers are parsed from
+FIELD_ATTRIBUTES = ['type', 'store', 'required', 'relation']
+
+
+def describe_model(model):
+    return {
+        'fields': {
+            field_name: {
+                attr: field[attr]
+                for attr in FIELD_ATTRIBUTES
+                if attr in field
+            }
+            for (field_name, field) in model.fields_get(attributes=FIELD_ATTRIBUTES).iteritems()
+        },
+        'sql_constraints': [
+            list(constraint)
+            for constraint in model._sql_constraints
+        ],
+    }
+
 
 _logger = logging.getLogger(__name__)
 
@@ -41,12 +80,116 @@ class ModelSerializer(object):
         self.model_name = model_name
         self.fields = OrderedDict()
         self.nk = nk or []
+        self._sql_fields = None
+        self._relation_fields = None
+
+    def sql_fields(self, model):
+        # Fields that are nothing more than a column of the model's table
+        if self._sql_fields is None:
+            self._sql_fields = set([
+                field_name for field_name in self.fields.iterkeys()
+                for field in [model._fields[field_name]]
+                if field.store and field.column_type
+                and field.type in sql_field_types
+                and not (field.compute or field.inherited or field.translate
+                    or field.company_dependent)
+            ])
+        return self._sql_fields
+
+    def relation_fields(self, model):
+        # Many2many fields whose value is all of their relation table
+        if self._relation_fields is None:
+            self._relation_fields = set([
+                field_name for field_name in self.fields.iterkeys()
+                for field in [model._fields[field_name]]
+                if field.type == 'many2many' and field.store
+                and not (field.compute or field.inherited or field.domain)
+            ])
+        return self._relation_fields
+
+    def _read_relations(self, records, fields):
+        # A single scan of the relation table per field, rather than
+        # going through the comodel.
+        result = dict([
+            (id, dict([(field_name, []) for field_name in fields]))
+            for id in records._ids
+        ])
+        for field_name in fields:
+            field = records._fields[field_name]
+            records.env.cr.execute('SELECT "%s", "%s" FROM "%s" WHERE "%s" IN %%s ORDER BY "%s", "%s"' % (
+                field.column1, field.column2, field.relation,
+                field.column1, field.column1, field.column2
+            ), (records._ids,))
+            for (id, value) in records.env.cr.fetchall():
+                result[id][field_name].append(value)
+        return result
 
-    def serialize(self, record, context, fields=None):
+    def _read_sql(self, records, fields):
+        # Same values as read() with load='_classic_write', without the
+        # ORM overhead.
+        records.env.cr.execute('SELECT id, %s FROM "%s" WHERE id IN %%s' % (
+            ', '.join(['"%s"' % field_name for field_name in fields]),
+            records._table
+        ), (records._ids,))
+
+        model_fields = [records._fields[field_name] for field_name in fields]
+        record = records.browse()
+        result = {}
+        for row in records.env.cr.fetchall():
+            result[row[0]] = dict([
+                (field.name, field.convert_to_read(
+                    field.convert_to_cache(value, record, validate=False),
+                    record,
+                    use_name_get=False
+                ))
+                for (field, value) in zip(model_fields, row[1:])
+            ])
+        return result
+
+    def read(self, records, fields=None, delayed=False):
+        # Many2many values are only serialized in the delayed pass,
+        # don't bother reading them before.
+        fields = [
+            field_name for field_name in (fields or self.fields.iterkeys())
+            if delayed or not isinstance(self.fields[field_name], ManyToManySerializer)
+        ]
+
+        if not fields or not records:
+            return [{'id': id} for id in records._ids]
+
+        sql_fields = self.sql_fields(records)
+        relation_fields = self.relation_fields(records)
+        orm_fields = [
+            field_name for field_name in fields
+            if field_name not in sql_fields and field_name not in relation_fields
+        ]
+        sql_fields = [field_name for field_name in fields if field_name in sql_fields]
+        relation_fields = [field_name for field_name in fields if field_name in relation_fields]
+
+        # Read raw values (plain ids for relations) for the whole
+        # recordset in one go.
+        if orm_fields:
+            rows = records.read(orm_fields, load='_classic_write')
+        else:
+            rows = [{'id': id} for id in records._ids]
+
+        if sql_fields:
+            values = self._read_sql(records, sql_fields)
+            rows = [row for row in rows if row['id'] in values]
+            for row in rows:
+                row.update(values[row['id']])
+
+        if relation_fields:
+            values = self._read_relations(records, relation_fields)
+            for row in rows:
+                row.update(values[row['id']])
+        return rows
+
+    def serialize(self, row, context, fields=None):
         result = {}
         for field_name in (fields or self.fields.iterkeys()):
             field = self.fields[field_name]
-            result[field_name] = field.serialize(record, context)
+            result[field_name] = field.serialize(row, context)
         return result
 
     def serialize_id(self, id, context):
@@ -56,9 +199,9 @@ class ModelSerializer(object):
 
         try:
             new_id = self._serialize_id(id, context)
-            if is_pk(new_id) and context.link:
-                return self._link_id(new_id, context)
-            else:
+            if is_pk(new_id):
+                if context.link:
+                    return self._link_id(new_id, context)
                 context.register_nk(self.model_name, new_id)
             return new_id
         except NaturalKeyMissing as ex:
@@ -68,10 +211,10 @@ class ModelSerializer(object):
                 raise ex
 
     def _link_id(self, id, context):
-        link = str(uuid.uuid4())
+        link = str(uuid.uuid5(context.link_namespace, '%s,%s' % (self.model_name, id)))
         if context.model_name != self.model_name:
             raise ModelMissing("Can not create a link for relation %s:%s, this model is not serialized" % ( self.model_name, id))
-        context.map(self.model_name, link, id)
+        # Links are only ever resolved from the pk on export
         context.map(self.model_name, id, link)
         _logger.debug("Link %s created for %s:%s" % (link, self.model_name, id))
         return link
@@ -82,19 +225,69 @@ class ModelSerializer(object):
                 raise NaturalKeyMissing("Did not serialize a natural key for %s:%s" % (self.model_name, id))
             return id
 
-        nk = {}
-        record = context.env[self.model_name].browse([id])[0]
-        for field_name in self.nk:
-            field = self.fields[field_name]
-            nk[field_name] = field.serialize(record, context)
+        nk = context.nk_cache.get((self.model_name, id), None)
+        context.stats.cache(self.model_name, nk is not None)
+        if nk is None:
+            records = context.env[self.model_name].browse([id])
+            nk = self._serialize_nk(self.read(records, fields=self.nk)[0], context)
+        return nk
+
+    def _serialize_nk(self, row, context):
+        nk = self.serialize(row, context, fields=self.nk)
 
         if context.strict:
             with context.new_entry(self.model_name) as entry_context:
-                if id != self.deserialize_id(nk, entry_context):
-                    raise NaturalKeyInvalid("Natural key invalid for %s:%s" % (self.model_name, id))
+                if row['id'] != self.deserialize_id(nk, entry_context):
+                    raise NaturalKeyInvalid("Natural key invalid for %s:%s" % (self.model_name, row['id']))
 
+        context.register_nk(self.model_name, nk)
+        context.nk_cache[(self.model_name, row['id'])] = nk
         return nk
 
+    def prefetch(self, rows, context, fields=None, seen=None):
+        # Collect all ids referenced by these rows, per relation
+        relations = {}
+        for field_name in (fields or self.fields.iterkeys()):
+            field = self.fields[field_name]
+            if not isinstance(field, RelationSerializer):
+                continue
+            ids = relations.setdefault(field.relation, set())
+            for row in rows:
+                value = row.get(field_name, False)
+                if isinstance(value, list):
+                    ids.update(value)
+                elif value:
+                    ids.add(value)
+
+        seen = seen if seen is not None else set()
+        for (relation, ids) in relations.iteritems():
+            context.serializers[relation].prefetch_ids(ids, context, seen=seen)
+
+    def prefetch_ids(self, ids, context, seen=None):
+        if not self.nk:
+            return
+
+        seen = seen if seen is not None else set()
+        ids = [
+            id for id in ids
+            if (self.model_name, id) not in context.nk_cache
+            and (self.model_name, id) not in seen
+        ]
+        if not ids:
+            return
+
+        seen.update([(self.model_name, id) for id in ids])
+        records = context.env[self.model_name].browse(ids)
+        rows = self.read(records, fields=self.nk)
+        self.prefetch(rows, context, fields=self.nk, seen=seen)
+        with context.new_record(None, None) as nk_context:
+            for row in rows:
+                try:
+                    self._serialize_nk(row, nk_context)
+                except (NaturalKeyError, LinkNotFound, ModelMissing):
+                    # Leave it to the regular path to report
+                    pass
+
     def deserialize(self, values, context):
         result = {}
         for field_name, value in values.iteritems():
@@ -129,6 +322,18 @@ class ModelSerializer(object):
             for (k, v) in nk.iteritems()
         ]
 
+        # Resolve through the index, only records created after building
+        # it still need to be searched for.
+        index = None
+        if set(nk.iterkeys()) == set(self.nk):
+            index = context.nk_index(self)
+        if index is not None:
+            resolved = index.lookup(self.nk_key(nk))
+            context.stats.cache(self.model_name, bool(resolved))
+            if resolved:
+                return resolved
+            lookup.append(('id', '>', index.max_id))
+
         model = context.env[self.model_name].with_context(active_test=False)
         records = model.search(lookup)
         if len(records) == 0:
@@ -136,10 +341,82 @@ class ModelSerializer(object):
         elif len(records) > 1:
             raise NaturalKeyMultipleFound("%s records found for model %s with lookup %s" % (len(records), self.model_name, lookup))
 
+        if index is not None:
+            index.add(records[0]._ids[0], self.nk_key(nk))
         return records[0]._ids[0]
 
+    def deserialize_ids(self, ids, context):
+        # Same as deserialize_id for many ids at once, returns None for
+        # ids that don't resolve. Natural keys are looked up with a
+        # single search.
+        result = [None] * len(ids)
+        nks = {}
+        for (i, id) in enumerate(ids):
+            try:
+                if is_nk(id) and set(id.iterkeys()) == set(self.nk) and not context.resolve(self.model_name, id):
+                    nks[i] = self.deserialize_id(id, context, no_lookup=True)
+                else:
+                    result[i] = self.deserialize_id(id, context)
+            except (LinkNotFound, NaturalKeyError):
+                pass
+
+        lookup = []
+        index = None
+        if nks:
+            index = context.nk_index(self)
+        if index is not None:
+            for (i, nk) in nks.items():
+                try:
+                    result[i] = index.lookup(self.nk_key(nk))
+                except NaturalKeyMultipleFound:
+                    del nks[i]
+                    continue
+                context.stats.cache(self.model_name, bool(result[i]))
+                if result[i]:
+                    del nks[i]
+            lookup = [('id', '>', index.max_id)]
+
+        if nks:
+            model = context.env[self.model_name].with_context(active_test=False)
+            records = model.search(expression.AND([lookup, expression.OR([
+                [(k, '=', v) for (k, v) in nk.iteritems()]
+                for nk in nks.itervalues()
+            ])]))
+
+            found = {}
+            for row in self.read(records, fields=self.nk):
+                found.setdefault(self.nk_key(row), []).append(row['id'])
+
+            for (i, nk) in nks.iteritems():
+                matches = found.get(self.nk_key(nk), [])
+                if len(matches) == 1:
+                    result[i] = matches[0]
+                    if index is not None:
+                        index.add(matches[0], self.nk_key(nk))
+
+        return result
+
+    def nk_key(self, values):
+        return tuple([
+            float(values[field_name]) if isinstance(values[field_name], Decimal)
+            else values[field_name] or False
+            for field_name in self.nk
+        ])
+
+    def index_id(self, id, context):
+        # Keeps an existing natural key index in sync with the stored
+        # values of a created or updated record.
+        self.index_ids([id], context)
+
+    def index_ids(self, ids, context):
+        index = context.nk_indexes.get(self.model_name, None)
+        if index is not None:
+            records = context.env[self.model_name].browse(ids)
+            for row in self.read(records, fields=self.nk):
+                index.add(row['id'], self.nk_key(row))
+
     @classmethod
-    def parse(cls, model_name, model, config):
+    def parse(cls, model_name, model, config, description=None):
         if any([
             # use getattr for Odoo 9 compatibility
             getattr(model, attr, False)
@@ -147,11 +424,14 @@ class ModelSerializer(object):
         ]):
             raise ValueError(model)
 
+        if description is None:
+            description = describe_model(model)
+
         model_config = config.models.get(model_name, None)
         nk = model_config and model_config.nk or None
         if nk is True:
             # Attempt to find suitable fk_fields from unique constraint
-            for constraint in model._sql_constraints:
+            for constraint in description['sql_constraints']:
                 constraint = ''.join(constraint[1].split()).lower()
                 if constraint.startswith('unique('):
                     nk = constraint[len('unique('):-1].split(',')
@@ -181,7 +461,7 @@ class ModelSerializer(object):
 
             return True
 
-        for field_name, field in model.fields_get().iteritems():
+        for field_name, field in description['fields'].iteritems():
             if include_field(field_name, field):
                 field_cls = field_types.get(field['type'], FieldSerializer)
                 field_serializer = field_cls.parse(
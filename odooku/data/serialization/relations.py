@@ -11,10 +11,10 @@ class RelationSerializer(BaseFieldSerializer):
         super(RelationSerializer, self).__init__(field_name, required=required)
         self.relation = relation
 
-    def serialize(self, record, context):
-        return self.serialize_relation(record, context)
+    def serialize(self, row, context):
+        return self.serialize_relation(row, context)
 
-    def serialize_relation(self, record, context):
+    def serialize_relation(self, row, context):
         raise NotImplementedError()
 
     def deserialize(self, values, context):
@@ -37,12 +37,12 @@ class RelationSerializer(BaseFieldSerializer):
 
 class ManyToOneSerializer(RelationSerializer):
 
-    def serialize_relation(self, record, context):
-        value = record.read([self.field_name])[0][self.field_name]
+    def serialize_relation(self, row, context):
+        value = row[self.field_name]
         if value:
             serializer = context.serializers[self.relation]
-            context.add_dependency(self.relation, value[0], self)
-            return serializer.serialize_id(value[0], context)
+            context.add_dependency(self.relation, value, self)
+            return serializer.serialize_id(value, context)
         return False
 
     def deserialize_relation(self, values, context):
@@ -55,10 +55,10 @@ class ManyToOneSerializer(RelationSerializer):
 
 class ManyToManySerializer(RelationSerializer):
 
-    def serialize_relation(self, record, context):
+    def serialize_relation(self, row, context):
         result = []
         if context.delayed:
-            value = record.read([self.field_name])[0][self.field_name]
+            value = row[self.field_name]
             if value:
                 serializer = context.serializers[self.relation]
                 for id in value:
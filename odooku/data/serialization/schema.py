@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+
+from odoo.tools import config as odoo_config
+
+from odooku.data.serialization.model import ModelSerializer, describe_model
+from odooku.data.serialization.relations import RelationSerializer
+
+
+_logger = logging.getLogger(__name__)
+
+
+def is_serializable(model):
+    return not any([
+        # use getattr for Odoo 9 compatibility
+        getattr(model, attr, False)
+        for attr in ['_transient', '_abstract']
+    ])
+
+
+class SchemaCache(object):
+
+    # Model descriptions stored on disk, valid for as long as the same
+    # modules and custom fields are installed.
+
+    def __init__(self, path=None):
+        self._path = path
+        self._models = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as fp:
+                    self._models = json.load(fp)
+            except ValueError:
+                _logger.warning("Ignoring invalid schema cache %s" % path)
+
+    @classmethod
+    def signature(cls, cr):
+        cr.execute("""
+            SELECT name, latest_version, write_date
+            FROM ir_module_module
+            WHERE state = 'installed'
+            ORDER BY name
+        """)
+        modules = cr.fetchall()
+        cr.execute("SELECT count(*), max(write_date) FROM ir_model_fields")
+        return hashlib.sha1(repr((modules, cr.fetchone()))).hexdigest()
+
+    @classmethod
+    def load(cls, env):
+        path = os.path.join(
+            odoo_config['data_dir'],
+            'odooku_schema',
+            '%s.json' % cls.signature(env.cr)
+        )
+        return cls(path)
+
+    def describe(self, model):
+        description = self._models.get(model._name, None)
+        if description is None:
+            description = self._models[model._name] = describe_model(model)
+            self._dirty = True
+        return description
+
+    def save(self):
+        if not (self._path and self._dirty):
+            return
+
+        try:
+            directory = os.path.dirname(self._path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self._path + '.tmp', 'w') as fp:
+                json.dump(self._models, fp)
+            os.rename(self._path + '.tmp', self._path)
+            self._dirty = False
+        except (IOError, OSError) as ex:
+            _logger.warning("Could not write schema cache %s: %s" % (self._path, ex))
+
+
+class SerializerMap(object):
+
+    # Serializers are only parsed for models that are actually used
+
+    def __init__(self, env, config, schema=None):
+        self._env = env
+        self._config = config
+        self._schema = schema
+        self._serializers = {}
+
+    def __contains__(self, model_name):
+        return model_name in self._env.registry and is_serializable(self._env[model_name])
+
+    def __getitem__(self, model_name):
+        serializer = self._serializers.get(model_name, None)
+        if serializer is None:
+            if model_name not in self:
+                raise KeyError(model_name)
+            model = self._env[model_name]
+            serializer = self._serializers[model_name] = ModelSerializer.parse(
+                model_name,
+                model,
+                config=self._config,
+                description=self._schema and self._schema.describe(model)
+            )
+        return serializer
+
+    def preload(self, model_names):
+        # Parses the given models and every model they relate to
+        pending = list(model_names)
+        while pending:
+            serializer = self[pending.pop()]
+            for field in serializer.fields.itervalues():
+                if (isinstance(field, RelationSerializer)
+                        and field.relation not in self._serializers
+                        and field.relation in self):
+                    pending.append(field.relation)
+
+    def iterkeys(self):
+        # use iterkeys instead of env iteritems for Odoo 9 compatibiltiy
+        for model_name in self._env.registry.iterkeys():
+            if is_serializable(self._env[model_name]):
+                yield model_name
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+import logging
+import resource
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Seconds between progress updates of a single model
+EMIT_INTERVAL = 1.0
+
+
+def peak_rss():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Stats(object):
+
+    # Per model timings and counters of a single export or import run.
+    # Time and queries since the previous record are attributed to the
+    # model being recorded.
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.models = OrderedDict()
+        self._cr = None
+
+    def _send(self, kind, name, value):
+        # Only the odooku logger talks to statsd
+        send = getattr(_logger, kind, None)
+        if send is not None:
+            send('%s.%s' % (self.prefix, name), value)
+
+    def _queries(self):
+        return getattr(self._cr, 'sql_log_count', 0)
+
+    def _model(self, model_name):
+        stats = self.models.get(model_name, None)
+        if stats is None:
+            stats = self.models[model_name] = {
+                'records': 0,
+                'total': None,
+                'time': 0.0,
+                'queries': 0,
+                'hits': 0,
+                'misses': 0,
+                'rss': 0,
+                'emitted': 0.0,
+            }
+        return stats
+
+    def start(self, cr):
+        self._cr = cr
+        self._time = time.time()
+        self._query_count = self._queries()
+
+    def expect(self, model_name, total):
+        self._model(model_name)['total'] = total
+
+    def cache(self, model_name, hit):
+        self._model(model_name)[hit and 'hits' or 'misses'] += 1
+
+    def record(self, model_name, count=1):
+        now = time.time()
+        queries = self._queries()
+        stats = self._model(model_name)
+        stats['records'] += count
+        stats['time'] += now - self._time
+        stats['queries'] += queries - self._query_count
+        stats['rss'] = peak_rss()
+        self._time = now
+        self._query_count = queries
+
+        if now - stats['emitted'] >= EMIT_INTERVAL:
+            stats['emitted'] = now
+            self._emit(model_name, stats)
+
+    def _emit(self, model_name, stats):
+        name = model_name.replace('.', '_')
+        self._send('gauge', '%s.records' % name, stats['records'])
+        self._send('gauge', '%s.queries' % name, stats['queries'])
+        if stats['time']:
+            self._send('gauge', '%s.records_per_second' % name, int(stats['records'] / stats['time']))
+        if stats['total']:
+            self._send('gauge', '%s.progress' % name, min(100, 100 * stats['records'] / stats['total']))
+        if stats['hits'] or stats['misses']:
+            self._send('gauge', '%s.cache_hit_rate' % name,
+                100 * stats['hits'] / (stats['hits'] + stats['misses']))
+        self._send('gauge', 'rss', stats['rss'])
+
+    def end(self):
+        for (model_name, stats) in self.models.iteritems():
+            self._emit(model_name, stats)
+            self._send('histogram', '%s.time' % model_name.replace('.', '_'), int(stats['time'] * 1000))
+
+    def summary(self):
+        lines = ["%-32s %10s %10s %12s %10s %8s %10s" % (
+            'model', 'records', 'seconds', 'records/s', 'queries', 'hits', 'rss (MB)'
+        )]
+        for (model_name, stats) in self.models.iteritems():
+            lookups = stats['hits'] + stats['misses']
+            lines.append("%-32s %10d %10.2f %12.1f %10d %7s%% %10.1f" % (
+                model_name,
+                stats['records'],
+                stats['time'],
+                stats['records'] / stats['time'] if stats['time'] else 0.0,
+                stats['queries'],
+                lookups and 100 * stats['hits'] / lookups or '-',
+                stats['rss'] / 1024.0,
+            ))
+        return '\n'.join(lines)
+
+    def report(self):
+        self.end()
+        for line in self.summary().splitlines():
+            _logger.info(line)
@@ -21,6 +21,9 @@ setup(
         'gevent-websocket==0.9.5',
         'ijson==2.3'
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     entry_points='''
         [console_scripts]
         odooku=odooku.cli:entrypoint